@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# coding=utf-8
+"""Times the stages of the CLDF build, the checker, the website import and the query server"""
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import threading
+import platform
+import tempfile
+import subprocess
+import http.client
+from pathlib import Path
+
+from lexibank_pronouns import Dataset, BuildProfile
+from synthetic import SyntheticCorpus
+
+REPO = Path(__file__).parent
+WEBSITE_DUMP = REPO / 'raw' / 'website_dump'
+
+sys.path.insert(0, str(REPO))
+sys.path.insert(0, str(WEBSITE_DUMP))
+
+
+class Timer(object):
+    """Collects the wall-clock time of named stages."""
+    def __init__(self):
+        self.stages = {}
+
+    def __call__(self, stage, func, *args, **kw):
+        start = time.perf_counter()
+        result = func(*args, **kw)
+        self.stages[stage] = self.stages.get(stage, 0) + time.perf_counter() - start
+        return result
+
+
+def copy_corpus(target):
+    """Copies the files the build reads into `target`."""
+    for name in ('metadata.json', 'etc/languages.tsv', 'etc/concepts.tsv', 'raw/sources.bib'):
+        (target / name).parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy(REPO / name, target / name)
+    for filename in sorted(REPO.joinpath('raw').glob('*/*.csv')):
+        (target / 'raw' / filename.parent.name).mkdir(exist_ok=True)
+        shutil.copy(filename, target / 'raw' / filename.parent.name / filename.name)
+
+
+def benchmark_build(directory):
+    """
+    Profiles a complete build of the corpus in `directory`, i.e.
+    `Dataset.cmd_makecldf` as run by `cldfbench makecldf`, with the stages
+    recorded by its `BuildProfile`.
+    """
+    dataset = type('BenchmarkDataset', (Dataset,), {'dir': directory})()
+    dataset.profile = BuildProfile(enabled=True)
+    args = argparse.Namespace(log=logging.getLogger('benchmark'), dev=True)
+
+    with dataset.profile.stage('makecldf'):
+        writer = dataset.cldf_writer(args)
+        args.writer = writer.__enter__()
+        dataset.cmd_makecldf(args)
+        writer.__exit__(None, None, None)
+
+    report = dataset.profile.report()
+    return {
+        'paradigms': report['files'],
+        'forms': report['rows'],
+        'stages': {name: stage['wall'] for name, stage in report['stages'].items()},
+        'profile': report,
+    }
+
+
+def benchmark_checker(directory):
+    """Times checker.py's checks of each raw file in `directory`."""
+    import checker
+
+    # check against the corpus' own catalogues rather than those of the repository
+    context = checker.Context(directory / 'etc', directory / 'raw').load()
+
+    times = []
+    for filename in sorted(directory.joinpath('raw').glob('*/*.csv')):
+        start = time.perf_counter()
+        checker.check_file(filename, context)
+        times.append(time.perf_counter() - start)
+    return {
+        'files': len(times),
+        'stages': {
+            'check': sum(times),
+            'check_file_mean': sum(times) / max(len(times), 1),
+            'check_file_max': max(times, default=0),
+        },
+    }
+
+
+def benchmark_website_import():
+    """Times the data stages of website_to_txt.py (the Glottolog lookups are cached)."""
+    import website_to_txt
+
+    timer = Timer()
+    models = timer('load_models', website_to_txt.load_models, WEBSITE_DUMP / 'dump.json.gz')
+
+    mappings = {}
+    for fields in models['pronouns.pronoun'].values():
+        mappings.setdefault(fields['paradigm'], []).extend(fields['entries'])
+    index = timer('index_paradigms', website_to_txt.index_paradigms, mappings, models['lexicon.lexicon'])
+    return {'records': sum(len(m) for m in models.values()), 'paradigms': len(index), 'stages': timer.stages}
+
+
+def percentiles(times):
+    times = sorted(times)
+    return {
+        'p50_ms': 1000 * times[len(times) // 2],
+        'p95_ms': 1000 * times[int(len(times) * 0.95)],
+        'max_ms': 1000 * times[-1],
+    }
+
+
+def benchmark_server(cldf_dir=REPO / 'cldf', clients=4, rounds=5):
+    """
+    Load-tests server.py on the dataset in `cldf_dir`: `clients` threads
+    request the paradigm of every language `rounds` times over kept-alive
+    connections. The first round is answered from the index and the others
+    from the response cache.
+    """
+    from server import PronounIndex, make_server
+
+    start = time.perf_counter()
+    index = PronounIndex(cldf_dir)
+    load = time.perf_counter() - start
+    server = make_server(index, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    paths = ['/languages/%s' % l for l in index.languages]
+    times = {'uncached': [], 'cached': []}
+
+    def client(paths):
+        connection = http.client.HTTPConnection(*server.server_address)
+        for i in range(rounds):
+            for path in paths:
+                start = time.perf_counter()
+                connection.request('GET', path)
+                response = connection.getresponse()
+                response.read()
+                assert response.status == 200
+                times['uncached' if i == 0 else 'cached'].append(time.perf_counter() - start)
+        connection.close()
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(paths[i::clients],)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+    server.server_close()
+
+    return {
+        'requests': len(paths) * rounds,
+        'clients': clients,
+        'requests_per_second': len(paths) * rounds / elapsed,
+        'stages': {'load': load},
+        'uncached': percentiles(times['uncached']),
+        'cached': percentiles(times['cached']),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=REPO, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks the build and validation pipeline.')
+    parser.add_argument(
+        "--scales", type=int, nargs='*', default=[10],
+        help='also run on synthetic corpora (see synthetic.py) this many times the size of the real one')
+    parser.add_argument("--output", type=Path, help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    results = {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'website_import': benchmark_website_import(),
+        'server': benchmark_server(),
+        'corpora': {},
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus = Path(tmp) / 'real'
+        copy_corpus(corpus)
+        size = len(list(corpus.joinpath('raw').glob('*/*.csv')))
+        results['corpora']['real'] = {
+            'build': benchmark_build(corpus), 'checker': benchmark_checker(corpus)}
+
+        for scale in args.scales:
+            corpus = Path(tmp) / ('x%d' % scale)
+            SyntheticCorpus(size * scale, seed=scale).write(corpus)
+            results['corpora']['x%d' % scale] = {
+                'build': benchmark_build(corpus), 'checker': benchmark_checker(corpus)}
+            shutil.rmtree(corpus)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        args.output.write_text(output, encoding='utf8')
+    else:
+        print(output)
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# coding=utf-8
+"""On-disk index of the entries of a BibTeX file"""
+import re
+import json
+import hashlib
+from pathlib import Path
+
+from cachefile import read_json, replacing
+
+# bump to invalidate existing indices
+INDEX_VERSION = 1
+
+ENTRY = re.compile(rb'^@', re.MULTILINE)
+HEADER = re.compile(rb'@\s*(\w+)\s*[{(]\s*([^,\s]+)\s*,')
+
+
+def cited_sources(forms):
+    """Returns the keys of the sources cited by `forms`, e.g. `a` and `b` for `a;b`."""
+    # values like 'a;b' are kept as one item of Source until written
+    return {k for f in forms for source in f['Source'] for k in source.split(';') if k}
+
+
+class BibIndex(object):
+    """
+    Index of the entries of a BibTeX file: key -> (byte offset, length,
+    hash of the entry's bytes), plus the parsed fields of each entry.
+
+    The index is kept in `index` (if given). Entries are only parsed when
+    their sources are asked for, and when the BibTeX file changes only the
+    entries whose bytes changed are parsed again. Entries are parsed one at
+    a time, so @string macros are not supported; @comment and @preamble
+    blocks are skipped.
+    """
+    def __init__(self, filename, index=None):
+        self.filename = Path(filename)
+        self.index = Path(index) if index else None
+        self.entries = {}  # key -> dict(offset, length, hash[, genre, fields])
+        self.stat = None
+        self.parsed = 0    # number of entries parsed
+        if self.index:
+            previous = read_json(self.index)
+            if previous.get('version') == INDEX_VERSION:
+                self.entries, self.stat = previous['entries'], previous['stat']
+        self.update()
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def keys(self):
+        return list(self.entries)
+
+    def update(self):
+        """Brings the index up to date with the BibTeX file, returning self."""
+        st = self.filename.stat()
+        stat = [st.st_mtime_ns, st.st_size]
+        if stat == self.stat:
+            return self
+
+        data = self.filename.read_bytes()
+        previous, self.entries = self.entries, {}
+        starts = [m.start() for m in ENTRY.finditer(data)] + [len(data)]
+        for start, end in zip(starts, starts[1:]):
+            chunk = data[start:end]
+            header = HEADER.match(chunk)
+            if not header or header.group(1).lower() in (b'comment', b'preamble', b'string'):
+                continue
+            key = header.group(2).decode('utf8')
+            digest = hashlib.sha1(chunk).hexdigest()
+            entry = previous.get(key)
+            if not entry or entry['hash'] != digest:
+                entry = dict(hash=digest)
+            self.entries[key] = dict(entry, offset=start, length=end - start)
+
+        self.stat = stat
+        self.write()
+        return self
+
+    def write(self):
+        if self.index:
+            with replacing(self.index) as f:
+                json.dump({
+                    'version': INDEX_VERSION,
+                    'stat': self.stat,
+                    'entries': self.entries,
+                }, f)
+
+    def parse(self, key):
+        """Parses the entry `key`, keeping its genre and fields in the index."""
+        from simplepybtex.database import parse_string
+        from pycldf.sources import Source
+
+        entries = parse_string(self.text(key), bib_format='bibtex').entries
+        source = Source.from_entry(key, entries[key])
+        self.entries[key].update(genre=source.genre, fields=dict(source))
+        self.parsed += 1
+
+    def text(self, key):
+        """Returns the BibTeX of the entry `key`, read from the file."""
+        entry = self.entries[key]
+        with open(self.filename, 'rb') as handle:
+            handle.seek(entry['offset'])
+            return handle.read(entry['length']).decode('utf8')
+
+    def sources(self, keys=None):
+        """
+        Returns `pycldf.sources.Source` objects for the entries `keys` (or
+        all entries), in the order of the BibTeX file.
+        """
+        from pycldf.sources import Source
+
+        self.update()
+        keys = self.entries if keys is None else set(keys)
+        parsed = self.parsed
+        sources = []
+        for key, entry in self.entries.items():
+            if key in keys:
+                if 'fields' not in entry:
+                    self.parse(key)
+                sources.append(Source(entry['genre'], key, **entry['fields']))
+        if self.parsed > parsed:
+            self.write()
+        return sources
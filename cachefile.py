@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+# coding=utf-8
+"""Reading and writing the JSON caches in .cache/"""
+import os
+import json
+import tempfile
+import contextlib
+from pathlib import Path
+
+
+def read_json(filename):
+    """
+    Returns the JSON object in `filename`, or an empty dict if the file is
+    missing or cannot be parsed (e.g. if it was left truncated), so a broken
+    cache is treated as an empty one.
+    """
+    try:
+        obj = json.loads(Path(filename).read_text(encoding='utf8'))
+    except (OSError, ValueError):
+        return {}
+    return obj if isinstance(obj, dict) else {}
+
+
+@contextlib.contextmanager
+def replacing(filename):
+    """
+    Opens a temporary file next to `filename` for writing, which replaces
+    `filename` only once it has been written completely.
+    """
+    filename = Path(filename)
+    filename.parent.mkdir(parents=True, exist_ok=True)
+    handle, tmp = tempfile.mkstemp(dir=filename.parent, prefix=".%s." % filename.name, suffix='.tmp')
+    try:
+        with open(handle, 'w', encoding='utf8') as f:
+            yield f
+        os.replace(tmp, filename)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
@@ -3,10 +3,27 @@
 """Tries to standardise glyphs tc"""
 
 import csvw
+import json
+import random
+import difflib
+import time
+import hashlib
+import functools
 import unicodedata
+import multiprocessing
 from pathlib import Path
+from collections import Counter, defaultdict
 
-EXTENSIONS_TO_IGNORE = ('.py', '.gz', '.zip')
+from bibindex import BibIndex
+from cachefile import read_json, replacing
+from registry import LanguageRegistry
+
+REPO = Path(__file__).parent
+
+# bump when the checks change, to invalidate the results cached in .cache/
+CHECKER_VERSION = 1
+
+EXTENSIONS_TO_IGNORE = ('.py', '.pyc', '.gz', '.zip')
 FILENAMES_TO_IGNORE = (
     'template.csv',
 )
@@ -41,36 +58,157 @@ def get(filename, delimiter=","):
         for row in reader:
             yield(row)
 
-def get_sources(filename):
-    with open(filename, 'r') as handle:
-        for line in handle:
-            if line.startswith("@"):
-                try:
-                    yield line.split("{")[1].strip().strip(',')
-                except:
-                    print(line)
-                    raise
+class SourceIndex(object):
+    """
+    Index of the BibTeX keys in raw/sources.bib, recording which files cite
+    each key as the checker runs.
+    """
+    def __init__(self, keys):
+        self.keys = set(keys)
+        self.folded = defaultdict(list)
+        for k in self.keys:
+            self.folded[k.lower()].append(k)
+        self.citations = defaultdict(Counter)  # key -> {filename: n}
+
+    def __contains__(self, key):
+        return key in self.keys
+
+    def __len__(self):
+        return len(self.keys)
+
+    def cite(self, filename, citations):
+        """Records the citations ({key: n}) of a file."""
+        for key, n in citations.items():
+            self.citations[key][filename] += n
+
+    def suggest(self, key, n=3):
+        """Returns known keys that `key` is probably a typo of."""
+        if key.lower() in self.folded:
+            return sorted(self.folded[key.lower()])
+        return difflib.get_close_matches(key, self.keys, n=n, cutoff=0.8)
+
+    def unused(self):
+        return sorted(k for k in self.keys if k not in self.citations and k != 'UNKNOWN')
+
+    def statistics(self):
+        """Returns {filename: (number of keys cited, number of citations)}."""
+        stats = defaultdict(lambda: [0, 0])
+        for key, files in self.citations.items():
+            for filename, n in files.items():
+                stats[filename][0] += 1
+                stats[filename][1] += n
+        return {f: tuple(v) for f, v in stats.items()}
+
+
+class DuplicateIndex(object):
+    """
+    Finds duplicated paradigms.
+
+    Each paradigm is reduced to its cells, the set of (parameter, word)
+    pairs. Exact duplicates share a hash of the sorted cells, so row order
+    does not matter. Near duplicates are found with MinHash signatures of
+    the cells, split into `bands` for locality sensitive hashing, so only
+    files sharing a band are compared rather than all pairs.
+    """
+    PRIME = (1 << 61) - 1
+
+    def __init__(self, permutations=64, bands=16, threshold=0.8, seed=1234):
+        assert permutations % bands == 0
+        self.rows = permutations // bands
+        self.bands = bands
+        self.threshold = threshold
+        rng = random.Random(seed)
+        self.permutations = [
+            (rng.randrange(1, self.PRIME), rng.randrange(self.PRIME)) for _ in range(permutations)]
+        self.hashes = defaultdict(list)    # content hash -> filenames
+        self.buckets = defaultdict(list)   # (band, band signature) -> filenames
+        self.signatures = {}
+
+    @staticmethod
+    def cell(parameter, word):
+        word = unicodedata.normalize('NFC', word.strip())
+        return (parameter.strip(), '∅' if word in ('-', '#') else word)
+
+    def _hash(self, text):
+        return int.from_bytes(hashlib.blake2b(text.encode('utf8'), digest_size=8).digest(), 'little')
+
+    def add(self, filename, cells):
+        cells = sorted(set(cells))
+        if not cells:
+            return
+        digest = hashlib.sha1(repr(cells).encode('utf8')).hexdigest()
+        self.hashes[digest].append(filename)
+
+        shingles = [self._hash("%s=%s" % c) for c in cells]
+        signature = tuple(
+            min((a * x + b) % self.PRIME for x in shingles) for a, b in self.permutations)
+        self.signatures[filename] = signature
+        for band in range(self.bands):
+            key = signature[band * self.rows:(band + 1) * self.rows]
+            self.buckets[(band, key)].append(filename)
+
+    @staticmethod
+    def same_language(files):
+        """Whether `files` are all codings of the same glottocode (e.g. inter-coder reliability files)."""
+        return len({Path(f).stem.split(" ")[-1] for f in files}) == 1
+
+    def exact(self):
+        """Returns the groups of files with identical content."""
+        return [sorted(files) for files in self.hashes.values() if len(files) > 1]
+
+    def similarity(self, a, b):
+        """Estimates the Jaccard similarity of the cells of two files."""
+        sa, sb = self.signatures[a], self.signatures[b]
+        return sum(x == y for x, y in zip(sa, sb)) / len(sa)
+
+    def near(self):
+        """
+        Returns (file, file, similarity) for pairs of files that are not exact
+        duplicates but share at least `threshold` of their cells.
+        """
+        exact = {frozenset(files) for files in self.exact()}
+        pairs = set()
+        for files in self.buckets.values():
+            for i, a in enumerate(files):
+                for b in files[i + 1:]:
+                    pairs.add(tuple(sorted((a, b))))
+        near = []
+        for a, b in sorted(pairs):
+            if any(a in group and b in group for group in exact):
+                continue
+            similarity = self.similarity(a, b)
+            if similarity >= self.threshold:
+                near.append((a, b, similarity))
+        return near
+
 
 class Checker(object):
+    """
+    Checks a raw paradigm file in a single pass over its rows.
 
-    known_files = None   # monkey patch later
-    
-    def __init__(self, filename):
+    By default the file is read, checked and reported on construction. With
+    `check=False` the caller streams rows through `iter_rows` instead, e.g.
+    to validate the rows the CLDF build is reading anyway. Lookups go to
+    `context`, by default the `Context` of this repository.
+    """
+
+    def __init__(self, filename, check=True, context=None):
         self.filename = filename
-        self.errors, self.rows = [], []
-        for row in get(filename, ','):
-            self.rows.append(row)
+        self.context = context or CONTEXT
+        self.errors = []
+        self.entries = 0
+        self.cells = set()
+        self.citations = Counter()
         
         if filename.suffix != '.csv':
             self.error(f"Invalid suffix: {filename}")
         
-        if filename.name not in self.known_files:
+        if filename.name not in self.context.known_files:
             self.error(f"File not listed in etc/languages.tsv")
-        else:
-            self.known_files[filename.name] += 1
 
-        self.check()
-        self.report()
+        if check:
+            self.check()
+            self.report()
 
     def error(self, msg):
         self.errors.append(msg)
@@ -86,50 +224,136 @@ class Checker(object):
         return unicodedata.normalize('NFC', text)
     
     def check(self):
-        entries = 0
-        for i, row in enumerate(self.rows, 1):
-            for e in EXPECTED_COLUMNS:
-                if e not in row:
-                    self.error(f"Missing expect column {e}")
-            
-            # some checks are only valid if we have a stored lexical item in `word`
-            entry = row.get('word', '#')
-            if entry == '#' or len(entry) == 0:
-                has_entry = False
-            else:
-                has_entry = True
-                entries += 1
-            
-            for col, value in row.items():
-                if col == 'parameter':
-                    if value not in PARAMETERS.keys():
-                        self.error(f"Unknown Parameter in row {i}: '{value}'")
-                elif col == 'description':
-                    pass # Not checked
-                    # if value not in PARAMETERS.values():
-                    #     self.error(f"Unknown Description in row {i}: '{value}'")
-                elif col in ('word', 'ipa', 'comment', 'translation'):
-                    if value != self.normalise(value):
-                        out = [unicodedata.name(char, 'UNKNOWN') for char in value]
-                        self.error(f"Not normalised in row {i}: {value} - {out}")
-                elif has_entry and col == 'glottocode':
-                    if len(value) != 8:
-                        self.error(f"Invalid Glottocode in row {i}: '{value}'")
-                elif has_entry and col == 'source':
-                    # if we have an entry in `word` we should have a source
-                    if value is None or len(value) == 0:
-                        self.error(f"Empty Source in row {i}: '{value}'")
-                    else:
-                        for s in [v for v in value.split(";")]:
-                            if s not in SOURCES:
-                                self.error(f"Unknown Source in row {i}: '{s}'")
-
-        if entries == 0:
+        for row in self.iter_rows(get(self.filename, ',')):
+            pass
+
+    def iter_rows(self, rows):
+        """Yields `rows` unchanged, checking each one as it passes."""
+        for i, row in enumerate(rows, 1):
+            self.check_row(i, row)
+            yield row
+
+        if self.entries == 0:
             self.error(f"Empty file!")
 
+    def check_row(self, i, row):
+        for e in EXPECTED_COLUMNS:
+            if e not in row:
+                self.error(f"Missing expect column {e}")
+        
+        # some checks are only valid if we have a stored lexical item in `word`
+        entry = row.get('word', '#')
+        if entry == '#' or len(entry) == 0:
+            has_entry = False
+        else:
+            has_entry = True
+            self.entries += 1
+            if entry != '?':
+                self.cells.add(DuplicateIndex.cell(row.get('parameter', ''), entry))
+        
+        for col, value in row.items():
+            if col == 'parameter':
+                if value not in self.context.parameters:
+                    self.error(f"Unknown Parameter in row {i}: '{value}'")
+            elif col == 'description':
+                pass # Not checked
+                # if value not in self.context.parameters.values():
+                #     self.error(f"Unknown Description in row {i}: '{value}'")
+            elif col in ('word', 'ipa', 'comment', 'translation'):
+                if value != self.normalise(value):
+                    out = [unicodedata.name(char, 'UNKNOWN') for char in value]
+                    self.error(f"Not normalised in row {i}: {value} - {out}")
+            elif has_entry and col == 'glottocode':
+                if len(value) != 8:
+                    self.error(f"Invalid Glottocode in row {i}: '{value}'")
+            elif has_entry and col == 'source':
+                # if we have an entry in `word` we should have a source
+                if value is None or len(value) == 0:
+                    self.error(f"Empty Source in row {i}: '{value}'")
+                else:
+                    for s in [v for v in value.split(";")]:
+                        self.citations[s] += 1
+                        if s not in self.context.sources:
+                            hint = ", ".join(self.context.sources.suggest(s))
+                            hint = f" - did you mean {hint}?" if hint else ""
+                            self.error(f"Unknown Source in row {i}: '{s}'{hint}")
+
+
+def file_hash(filename):
+    return hashlib.sha1(Path(filename).read_bytes()).hexdigest()
+
+
+class ResultCache(object):
+    """
+    The results of checking each file in earlier runs, keyed by the file's
+    content hash, so unchanged files need not be checked again.
+
+    All results are discarded if CHECKER_VERSION or any of the files the
+    checks depend on (`dependencies`) change.
+    """
+    def __init__(self, filename, dependencies):
+        self.filename = filename
+        self.namespace = [CHECKER_VERSION] + [file_hash(d) for d in dependencies]
+        self.files, self.previous = {}, {}
+        previous = read_json(self.filename)
+        if previous.get('namespace') == self.namespace:
+            self.previous = previous['files']
+
+    def get(self, key, digest):
+        entry = self.previous.get(key)
+        if entry and entry['hash'] == digest:
+            return entry['result']
+        return None
+
+    def update(self, key, digest, result):
+        self.files[key] = {'hash': digest, 'result': result}
+
+    def write(self):
+        with replacing(self.filename) as f:
+            json.dump({'namespace': self.namespace, 'files': self.files}, f)
+
+
+def check_file(filename, context=None):
+    """
+    Checks `filename`, returning the errors, cells and citations found as a
+    JSON serialisable dict so it can be cached or sent from a worker process.
+    """
+    try:
+        c = Checker(filename, check=False, context=context)
+        c.check()
+    except Exception as e:
+        print(f"Error reading {filename}: {e}")
+        raise
+    return {
+        'errors': c.errors,
+        'cells': sorted(c.cells),
+        'citations': dict(c.citations),
+    }
+
+
+def _set_context(context):
+    global CONTEXT
+    CONTEXT = context
+
+
+def iter_checked(filenames, processes=1, context=None):
+    """Yields the results of `check_file` for `filenames`, in order."""
+    context = context or CONTEXT
+    if processes > 1 and len(filenames) > 1:
+        # workers get a snapshot of the loaded context rather than reading
+        # the catalogues again
+        with multiprocessing.Pool(
+                processes, initializer=_set_context, initargs=(context.load(),)) as pool:
+            yield from pool.imap(check_file, filenames, chunksize=8)
+    else:
+        for filename in filenames:
+            yield check_file(filename, context)
+
 
-def check_languages_tsv(filename="etc/languages.tsv"):
-    for i, row in enumerate(get(filename, "\t"), 2):
+def check_languages_tsv(languages=None):
+    if languages is None:
+        languages = CONTEXT.languages
+    for i, row in enumerate(languages.rows, 2):
         lid = int(row['LocalID'])
 
         # checks
@@ -149,27 +373,239 @@ def check_languages_tsv(filename="etc/languages.tsv"):
             yield f"L{i} - no coder"
         elif row['Coder'] not in CODERS:
             yield f"L{i} - bad coder '{row['Coder']}'"
+
+    yield from languages.check()
         
 
-PARAMETERS = {o['ID']: o['English'] for o in get('etc/concepts.tsv', "\t")}
+def load_parameters(filename=REPO / 'etc' / 'concepts.tsv'):
+    return {o['ID']: o['English'] for o in get(filename, "\t")}
+
+
+def load_sources(filename=REPO / 'raw' / 'sources.bib', index=None):
+    return SourceIndex(BibIndex(filename, index).keys() + ['UNKNOWN'])
+
+
+def load_languages(filename=REPO / 'etc' / 'languages.tsv', raw_dir=REPO / 'raw'):
+    return LanguageRegistry.from_tsv(filename, raw_dir)
+
+
+class Context(object):
+    """
+    The catalogues the checks look things up in: the parameters of
+    etc/concepts.tsv, the keys of raw/sources.bib and the `LanguageRegistry`
+    of etc/languages.tsv. Each is read on first use and kept, so importing
+    the checker is cheap and many `Checker`s can share one context (the
+    build sets `languages` to its own registry).
+
+    Contexts pickle with whatever they have loaded, so worker processes can
+    be sent a snapshot.
+    """
+    def __init__(self, etc_dir=REPO / 'etc', raw_dir=REPO / 'raw', cache_dir=None):
+        self.concepts_tsv = Path(etc_dir) / 'concepts.tsv'
+        self.languages_tsv = Path(etc_dir) / 'languages.tsv'
+        self.sources_bib = Path(raw_dir) / 'sources.bib'
+        self.raw_dir = Path(raw_dir)
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+
+    @functools.cached_property
+    def parameters(self):
+        return load_parameters(self.concepts_tsv)
+
+    @functools.cached_property
+    def sources(self):
+        # with a `cache_dir`, the index of raw/sources.bib is kept on disk so
+        # only changed entries are parsed
+        return load_sources(
+            self.sources_bib, self.cache_dir / 'sources.json' if self.cache_dir else None)
+
+    @functools.cached_property
+    def languages(self):
+        return load_languages(self.languages_tsv, self.raw_dir)
+
+    @property
+    def known_files(self):
+        return self.languages.filenames
+
+    def load(self):
+        """Loads all catalogues, e.g. before pickling."""
+        self.parameters, self.sources, self.languages
+        return self
+
+    def reload(self, name):
+        """Drops the catalogue `name`, to be read again on next use."""
+        self.__dict__.pop(name, None)
+
+
+def iter_raw_files(raw_dir=REPO / 'raw'):
+    """Yields the paradigm files in `raw_dir`, in sorted order."""
+    for p in sorted(raw_dir.glob("*/*")):
+        if not (p.is_dir() or p.suffix in EXTENSIONS_TO_IGNORE or p.name in FILENAMES_TO_IGNORE):
+            yield p
+
+
+def display(filename):
+    """Returns `filename` as shown in reports, i.e. relative to the repository if within it."""
+    try:
+        return filename.relative_to(REPO)
+    except ValueError:
+        return filename
+
+
+class Watcher(object):
+    """
+    Re-checks raw files as they are saved, polling the modification times of
+    the raw files and of the files the checks depend on every `interval`
+    seconds.
+
+    A changed paradigm file is checked on its own. If etc/concepts.tsv
+    changes, every file is checked again; if raw/sources.bib or
+    etc/languages.tsv change, only the files citing an added or removed key,
+    or whose listing changed, are.
+    """
+    def __init__(self, raw_dir=REPO / 'raw', etc_dir=REPO / 'etc', interval=0.5):
+        self.raw_dir = raw_dir
+        self.interval = interval
+        self.context = Context(etc_dir, raw_dir, cache_dir=REPO / '.cache').load()
+        self.dependencies = {
+            self.context.concepts_tsv: self.reload_parameters,
+            self.context.sources_bib: self.reload_sources,
+            self.context.languages_tsv: self.reload_known_files,
+        }
+        self.results = {}  # filename -> result of `check_file`
+        self.stats = {}
+
+    def stat(self, filename):
+        try:
+            st = filename.stat()
+            return (st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            return None
+
+    def scan(self):
+        """Returns {filename: (mtime, size)} for the watched files."""
+        stats = {p: self.stat(p) for p in iter_raw_files(self.raw_dir)}
+        stats.update({p: self.stat(p) for p in self.dependencies})
+        return stats
+
+    def check(self, filenames, verbose=True):
+        for p in sorted(filenames):
+            if not p.exists():
+                self.results.pop(p, None)
+                print(f"{display(p)}: removed")
+                continue
+            try:
+                self.results[p] = check_file(p, self.context)
+            except Exception:  # e.g. a half-saved file, we'll see it again
+                continue
+            if self.results[p]['errors']:
+                print(f"{display(p)}:")
+                for e in self.results[p]['errors']:
+                    print(f" {e}")
+            elif verbose:
+                print(f"{display(p)}: OK")
+
+    def reload_parameters(self, filename):
+        self.context.reload('parameters')
+        return set(self.results)
+
+    def reload_sources(self, filename):
+        old = self.context.sources.keys
+        self.context.reload('sources')
+        changed = old ^ self.context.sources.keys
+        return {p for p, r in self.results.items() if changed.intersection(r['citations'])}
+
+    def reload_known_files(self, filename):
+        old = self.context.known_files
+        self.context.reload('languages')
+        for e in check_languages_tsv(self.context.languages):
+            print(f"{display(filename)}: {e}")
+        changed = old ^ self.context.known_files
+        return {p for p in self.results if p.name in changed}
+
+    def run(self):
+        self.stats = self.scan()
+        self.check([p for p in self.stats if p not in self.dependencies], verbose=False)
+        print(f"\nWatching {len(self.results)} files for changes (Ctrl-C to stop) ...")
+        while True:
+            time.sleep(self.interval)
+            stats = self.scan()
+            changed = {p for p in set(stats) | set(self.stats) if stats.get(p) != self.stats.get(p)}
+            self.stats = stats
+            if not changed:
+                continue
 
-SOURCES = list(get_sources('./raw/sources.bib'))
-SOURCES.append('UNKNOWN')
+            start = time.perf_counter()
+            print(f"\n[{time.strftime('%H:%M:%S')}]")
+            todo = {p for p in changed if p not in self.dependencies}
+            for p, reload in self.dependencies.items():
+                if p in changed and stats[p]:
+                    todo |= reload(p)
+            self.check(todo)
+            print(f"({len(todo)} files checked in {time.perf_counter() - start:.2f}s)")
 
-Checker.known_files = {o['Filename']: 0 for o in get('etc/languages.tsv', "\t")}
+
+CONTEXT = Context(cache_dir=REPO / '.cache')
+
+
+def __getattr__(name):
+    # PARAMETERS and SOURCES used to be read on import
+    if name == 'PARAMETERS':
+        return CONTEXT.parameters
+    if name == 'SOURCES':
+        return CONTEXT.sources
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 if __name__ == '__main__':
-    errors = 0
-    for p in sorted(Path("raw").glob("*/*")):
-        if p.is_dir() or p.suffix in EXTENSIONS_TO_IGNORE or p.name in FILENAMES_TO_IGNORE:
-            continue
+    import argparse
+    parser = argparse.ArgumentParser(description='Checks the raw data files.')
+    parser.add_argument(
+        "--sources", action='store_true', help='list the sources cited by each file')
+    parser.add_argument(
+        "--processes", type=int, default=multiprocessing.cpu_count(),
+        help='the number of processes checking files in parallel')
+    parser.add_argument(
+        "--no-cache", action='store_true', help='check all files, not only those changed')
+    parser.add_argument(
+        "--watch", action='store_true', help='keep running, re-checking files as they change')
+    args = parser.parse_args()
+
+    if args.watch:
         try:
-            c = Checker(p)
-            errors += len(c.errors)
-        except Exception as e:
-            print(f"Error reading {p}: {e}")
-            raise
+            Watcher().run()
+        except KeyboardInterrupt:
+            pass
+        raise SystemExit()
+
+    filenames = list(iter_raw_files(CONTEXT.raw_dir))
+
+    # results for unchanged files are reused from the previous run, keyed
+    # by their path in raw/
+    cache = ResultCache(
+        REPO / '.cache' / 'checker.json',
+        dependencies=[CONTEXT.concepts_tsv, CONTEXT.languages_tsv, CONTEXT.sources_bib])
+    keys = {p: p.relative_to(CONTEXT.raw_dir).as_posix() for p in filenames}
+    digests = {p: file_hash(p) for p in filenames}
+    results = {} if args.no_cache else {p: cache.get(keys[p], digests[p]) for p in filenames}
+    checked = iter_checked(
+        [p for p in filenames if results.get(p) is None], processes=args.processes)
+
+    errors = 0
+    seen = Counter()
+    duplicates = DuplicateIndex()
+    for p in filenames:
+        result = results.get(p) or next(checked)
+        cache.update(keys[p], digests[p], result)
+
+        if result['errors']:
+            print(f"{display(p)}:")
+        for e in result['errors']:
+            print(f" {e}")
+        errors += len(result['errors'])
+        duplicates.add(display(p), [tuple(cell) for cell in result['cells']])
+        CONTEXT.sources.cite(p.name, result['citations'])
+        seen[p.name] += 1
+    cache.write()
     
     # check languages.tsv
     print("\n./etc/languages.tsv:")
@@ -177,9 +613,37 @@ if __name__ == '__main__':
         print(f" {e}")
         errors += 1
 
-    for f in sorted(Checker.known_files):
-        if Checker.known_files[f] != 1:
-            print(f" `{f}` seen {Checker.known_files[f]} times.")
+    for f in sorted(CONTEXT.known_files):
+        if seen[f] != 1:
+            print(f" `{f}` seen {seen[f]} times.")
             errors += 1
+
+    # duplicated paradigms. Identical codings of the same language (e.g. the
+    # [ICR ...] inter-coder reliability files) are expected.
+    for files in duplicates.exact():
+        if DuplicateIndex.same_language(files):
+            print(f"\nIdentical codings of the same language:")
+        else:
+            print(f"\nDuplicate paradigms:")
+            errors += 1
+        for f in files:
+            print(f" {f}")
+
+    near = duplicates.near()
+    if near:
+        print(f"\nSimilar paradigms (check these are not duplicates):")
+        for a, b, similarity in near:
+            print(f" {a} ~ {b} ({similarity:.0%})")
+
+    unused = CONTEXT.sources.unused()
+    if unused:
+        print(f"\n./raw/sources.bib: {len(unused)} unused sources")
+        for key in unused:
+            print(f" {key}")
+
+    if args.sources:
+        print("\nSource citations (keys / citations):")
+        for f, (keys, citations) in sorted(CONTEXT.sources.statistics().items()):
+            print(f" {f}: {keys} / {citations}")
     
     print(f"\n\nTOTAL ERRORS: {errors}\n")
\ No newline at end of file
@@ -1,16 +1,38 @@
+import os
+import sys
+import mmap
+import time
 import gzip
 import json
+import struct
+import sqlite3
+import cProfile
+import hashlib
 import logging
+import tempfile
+import functools
+import multiprocessing
 import dataclasses
-from collections import defaultdict
+from decimal import Decimal
+from collections import Counter, defaultdict, OrderedDict
 from pathlib import Path
 from typing import Optional
 
 import csvw
+import numpy
 import pylexibank
 from clldutils.misc import slug
 from pylexibank.util import progressbar
 
+from bibindex import BibIndex, cited_sources
+from cachefile import read_json, replacing
+from registry import LanguageRegistry
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None
+
 
 @dataclasses.dataclass
 class PronounConcept(pylexibank.Concept):
@@ -46,27 +68,948 @@ class PronounLanguage(pylexibank.Language):
 
 
 
+# bump to invalidate the artefacts cached in .cache/ by earlier builds
+BUILD_VERSION = 2
+
+
+def option(name, default=None):
+    """Returns the build option `name`, set as environment variable PRONOUNS_<NAME>."""
+    return os.environ.get('PRONOUNS_%s' % name.upper(), default)
+
+
+def flag(name):
+    """Returns whether the build option `name` is on, i.e. set to anything but '', 0, false or no."""
+    return (option(name) or '').strip().lower() not in ('', '0', 'false', 'no')
+
+
+def file_hash(filename):
+    return hashlib.sha1(Path(filename).read_bytes()).hexdigest()
+
+
+class BuildManifest(object):
+    """
+    Content hashes of the raw paradigm files and the forms they produced in
+    the previous build, so unchanged files need not be re-read and re-split.
+
+    All cached forms are discarded if BUILD_VERSION, anything splitting and
+    segmentation depend on (the form specification, etc/lexemes,
+    etc/segments and the orthography profiles) or etc/languages.tsv and
+    etc/concepts.tsv change. raw/sources.bib is recorded but does not affect
+    the forms; it does affect the checker's errors, which are kept for files
+    checked during the build.
+
+    The entries of the current build are spooled to a temporary file rather
+    than kept in memory, and the previous build's are only loaded if `load`.
+    """
+    def __init__(self, filename, dependencies, sources=None, load=True):
+        self.filename = filename
+        self.dependencies = dependencies
+        self.sources = file_hash(sources) if sources else None
+        self.previous, self.previous_sources = {}, None
+        self.files = tempfile.TemporaryFile('w+', encoding='utf8')
+        if load:
+            previous = read_json(self.filename)
+            if previous.get('version') == BUILD_VERSION and \
+                    previous.get('dependencies') == self.dependencies:
+                self.previous = previous['files']
+                self.previous_sources = previous.get('sources')
+
+    def get(self, key, digest, checked=False):
+        """
+        Returns the cached entry for `key` (with its `forms`, its `warnings`
+        if any, and `errors` if it was checked) if its content hash is
+        unchanged. With `checked`,
+        only entries checked against the same raw/sources.bib are returned.
+        """
+        entry = self.previous.get(key)
+        if entry and entry['hash'] == digest:
+            if not checked or ('errors' in entry and self.previous_sources == self.sources):
+                return entry
+        return None
+
+    def update(self, key, digest, forms, errors=None, warnings=None):
+        entry = {'hash': digest, 'forms': forms}
+        if warnings:
+            entry['warnings'] = warnings
+        if errors is not None:
+            entry['errors'] = errors
+        self.files.write('%s: %s\n' % (json.dumps(key), json.dumps(entry)))
+
+    def write(self):
+        # the same JSON as json.dumps of the whole manifest, written entry by entry
+        self.files.seek(0)
+        with replacing(self.filename) as out:
+            out.write(json.dumps({
+                'version': BUILD_VERSION,
+                'dependencies': self.dependencies,
+                'sources': self.sources,
+                'files': {},
+            })[:-2])
+            for i, line in enumerate(self.files):
+                out.write((', ' if i else '') + line[:-1])
+            out.write('}}')
+        self.files.close()
+
+
+class FormCache(object):
+    """
+    Size-bounded, persistent cache of how raw values were split into forms
+    and segmented, so repeated values (e.g. `ni` or `∅`) are only processed
+    once across files and builds.
+
+    Entries are kept in least-recently-used order and the cache is emptied
+    whenever its `namespace` (a hash of everything splitting and
+    segmentation depend on) changes. Values of the languages in `profiles`,
+    which have their own orthography profile in etc/orthography/, are
+    cached per language.
+    """
+    # the lexeme fields filled in by splitting and segmentation
+    fields = ('Form', 'Segments', 'Graphemes', 'Profile')
+
+    def __init__(self, filename, namespace, size=100000, profiles=()):
+        self.filename = filename
+        self.namespace = namespace
+        self.size = size
+        self.profiles = set(profiles)
+        self.entries = OrderedDict()
+        self.hits = self.misses = 0
+        if self.size:
+            previous = read_json(self.filename)
+            if previous.get('namespace') == self.namespace:
+                self.entries.update(previous['entries'])
+
+    def __bool__(self):
+        return bool(self.size)
+
+    def key(self, value, language=None):
+        # pylexibank segments the forms of a language with a profile of the same name
+        return '%s\t%s' % (language, value) if language in self.profiles else value
+
+    def get(self, value, language=None):
+        key = self.key(value, language)
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, value, lexemes, language=None):
+        self.entries[self.key(value, language)] = [
+            {k: lex[k] for k in self.fields if lex.get(k) is not None} for lex in lexemes]
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def write(self):
+        with replacing(self.filename) as f:
+            json.dump({'namespace': self.namespace, 'entries': self.entries}, f)
+
+
+class FormStream(object):
+    """
+    Stands in for the writer's list of forms, writing each form to the
+    FormTable's file as it is added. Only the number of forms and the sources
+    they cite are kept in memory; the writer itself keeps the set of form IDs.
+
+    Iterating reads the forms back from the file. The writer does not do so
+    itself, as pylexibank's `writer_options` keep all languages and
+    parameters rather than filtering them by the forms.
+    """
+    def __init__(self, table):
+        self.table = table
+        self.filename = table.url.resolve(table.base)
+        self.columns = [c for c in table.tableSchema.columns if not c.virtual]
+        self.sources = set()
+        self.count = 0
+        self.writer = csvw.UnicodeWriter(self.filename, dialect=table._get_dialect()).__enter__()
+        self.writer.writerow([c.header for c in self.columns])
+
+    def __len__(self):
+        return self.count
+
+    def append(self, item):
+        self.writer.writerow([
+            col.write(item.get(col.header, item.get('%s' % col))) for col in self.columns])
+        self.sources.update(cited_sources([item]))
+        self.count += 1
+
+    def __iter__(self):
+        if self.writer:
+            self.writer.f.flush()
+        yield from self.table.iterdicts(fname=self.filename)
+
+    def close(self):
+        if self.writer:
+            self.writer.__exit__(None, None, None)
+            self.writer = None
+
+    def wrap(self, write):
+        """Wraps the writer's `write` to finish the file instead of writing all forms."""
+        @functools.wraps(write)
+        def wrapper(**kw):
+            if kw.get('FormTable') is self:
+                del kw['FormTable']
+                self.close()
+                self.table.common_props['dc:extent'] = self.count
+            return write(**kw)
+        return wrapper
+
+
+class BuildProfile(object):
+    """
+    Instrumentation of a build: wall and CPU time per stage, rows and time
+    per raw file, counts of warnings by kind and peak memory.
+
+    Warnings are always counted; timings are only taken if `enabled`, so the
+    hooks cost next to nothing in a normal build. Stages may nest, e.g.
+    `split` is part of `add_forms`.
+    """
+    class Stage(object):
+        def __init__(self, profile, name):
+            self.profile, self.name = profile, name
+
+        def __enter__(self):
+            self.wall, self.cpu = time.perf_counter(), time.process_time()
+
+        def __exit__(self, *exc):
+            stage = self.profile.stages[self.name]
+            stage['wall'] += time.perf_counter() - self.wall
+            stage['cpu'] += time.process_time() - self.cpu
+            stage['calls'] += 1
+
+    class NoStage(object):
+        def __enter__(self):
+            pass
+
+        def __exit__(self, *exc):
+            pass
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.stages = defaultdict(lambda: {'wall': 0.0, 'cpu': 0.0, 'calls': 0})
+        self.files = {}
+        self.warnings = Counter()
+        self.nostage = self.NoStage()
+
+    def stage(self, name):
+        """Returns a context manager timing the `name` stage."""
+        return self.Stage(self, name) if self.enabled else self.nostage
+
+    def wrap(self, name, func):
+        """Returns `func`, timed as the `name` stage."""
+        @functools.wraps(func)
+        def wrapper(*args, **kw):
+            with self.stage(name):
+                return func(*args, **kw)
+        return wrapper
+
+    def warn(self, kind, message):
+        self.warnings[kind] += 1
+        logging.warn(message)
+
+    def file(self, name, rows, seconds):
+        self.files[name] = (rows, seconds)
+
+    def peak_memory(self):
+        """Returns the peak resident memory of the build process in KiB, where known."""
+        if resource is None:
+            return None
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak // 1024 if sys.platform == 'darwin' else peak
+
+    def report(self, slowest=10):
+        rows = sum(r for r, _ in self.files.values())
+        seconds = sum(s for _, s in self.files.values())
+
+        def throughput(rows, seconds):
+            return round(rows / seconds, 1) if seconds else None
+
+        return {
+            'files': len(self.files),
+            'rows': rows,
+            'rows_per_second': throughput(rows, seconds),
+            'stages': {
+                name: {'wall': round(s['wall'], 4), 'cpu': round(s['cpu'], 4), 'calls': s['calls']}
+                for name, s in self.stages.items()},
+            'slowest_files': [
+                {'file': name, 'rows': r, 'seconds': round(s, 4), 'rows_per_second': throughput(r, s)}
+                for name, (r, s) in sorted(self.files.items(), key=lambda i: -i[1][1])[:slowest]],
+            'warnings': dict(self.warnings),
+            'peak_memory_kib': self.peak_memory(),
+        }
+
+
 def get_language(x):
     x = x.split(" ")
     return (" ".join(x[0:-1]), x[-1])
 
 
-def read_text_files(filenames):
+def get_value(row):
+    value = row['word']
+    if value in ('-', '#'):
+        value = '∅'
+    return value
+
+
+def read_text_file(filename, form_spec=None, lexemes=None, checker=None):
+    """
+    Returns the rows of a paradigm file which have a word, as a list of
+    (language, glottocode, filename, row) tuples.
+
+    If `form_spec` is given, each tuple also gets the list of forms split
+    from the value, so that the splitting can happen in a worker process.
+    If a `checker.Checker` instance is given, every row is validated as it
+    is read.
+    """
     expected_columns = ('word', 'ipa', 'parameter', 'comment', 'glottocode', 'source')
-    for filename in filenames:
-        language, glottocode = get_language(filename.stem)
-        with csvw.UnicodeDictReader(filename, delimiter=",") as reader:
-            for row in reader:
-                if not all([e in row for e in expected_columns]):
-                    raise ValueError(
-                    "File %s missing expected column: %r" % (
-                        filename,
-                        [e for e in expected_columns if e not in row]
-                    ))
-                if row['word'] and row['word'] not in ('', '?'):
-                    yield (language, glottocode, filename.name, row)
+    language, glottocode = get_language(filename.stem)
+    records = []
+    with csvw.UnicodeDictReader(filename, delimiter=",") as reader:
+        for row in (checker.iter_rows(reader) if checker else reader):
+            if not all([e in row for e in expected_columns]):
+                raise ValueError(
+                "File %s missing expected column: %r" % (
+                    filename,
+                    [e for e in expected_columns if e not in row]
+                ))
+            if row['word'] and row['word'] not in ('', '?'):
+                record = (language, glottocode, filename.name, row)
+                if form_spec:
+                    record += (form_spec.split(row, get_value(row), lexemes=lexemes),)
+                records.append(record)
+    return records
+
+
+def check_text_file(filename, checker=None, **kw):
+    """
+    Reads a paradigm file, validating it with `checker` (the `checker.Checker`
+    class) in the same pass if given. Returns (records, errors).
+    """
+    if checker is None:
+        return read_text_file(filename, **kw), []
+    checker = checker(filename, check=False)
+    return read_text_file(filename, checker=checker, **kw), checker.errors
+
+
+# the keyword arguments of `check_text_file` in a worker process
+WORKER_OPTIONS = {}
+
+
+def _set_worker_options(kw):
+    global WORKER_OPTIONS
+    WORKER_OPTIONS = kw
+
+
+def _check_text_file(filename):
+    return check_text_file(filename, **WORKER_OPTIONS)
+
+
+def iter_text_files(filenames, processes=1, **kw):
+    """
+    Yields (filename, records, errors) for each paradigm file in the order of
+    `filenames`, parsing the files in a pool of `processes` workers if more
+    than one is requested. Keyword arguments go to `check_text_file`.
+    """
+    if processes > 1:
+        # workers get the keyword arguments (e.g. the checker's loaded
+        # context) once rather than with every chunk of files
+        with multiprocessing.Pool(
+                processes, initializer=_set_worker_options, initargs=(kw,)) as pool:
+            for filename, (records, errors) in zip(filenames, pool.imap(
+                    _check_text_file, filenames, chunksize=8)):
+                yield (filename, records, errors)
+    else:
+        for filename in filenames:
+            yield (filename,) + check_text_file(filename, **kw)
+
+
+def read_text_files(filenames, processes=1):
+    for filename, records, _ in iter_text_files(filenames, processes=processes):
+        yield from records
+
+
+COLUMNS_MAGIC = b'PRONCOL1'
+
+# columns stored as integer codes into a pool of distinct labels
+DICTIONARY_COLUMNS = ('Language_ID', 'Parameter_ID', 'Paradigm_ID')
+
+# columns stored as one string per row, with the separators used to join lists
+STRING_COLUMNS = {
+    'ID': None,
+    'Value': None,
+    'Form': None,
+    'Segments': ' ',
+    'Comment': None,
+    'Source': ';',
+}
+
+
+def _aligned(n, alignment=8):
+    return n + (-n % alignment)
+
+
+def _string_pool(strings):
+    encoded = [s.encode('utf8') for s in strings]
+    offsets = numpy.zeros(len(encoded) + 1, dtype='<i8')
+    numpy.cumsum([len(e) for e in encoded], out=offsets[1:])
+    return offsets, numpy.frombuffer(b''.join(encoded), dtype='u1')
+
+
+def write_columns(filename, forms):
+    """
+    Writes `forms` (FormTable rows as dicts) to `filename` in a columnar
+    binary format that `ColumnarForms` can memory-map.
+
+    The file starts with COLUMNS_MAGIC, the length of a JSON header as
+    little-endian uint64 and the header itself, which maps buffer names to
+    [dtype, offset, count]. The buffers follow, each aligned to 8 bytes.
+    Dictionary columns have `<col>.codes` (int32, -1 for missing) plus a
+    string pool of labels, string columns just a string pool; a pool is
+    made of `<col>.offsets` (int64) and `<col>.data` (UTF-8 bytes).
+    """
+    buffers = {}
+    for col in DICTIONARY_COLUMNS:
+        values = [f.get(col) for f in forms]
+        labels = sorted({str(v) for v in values if v is not None})
+        index = {label: i for i, label in enumerate(labels)}
+        buffers[col + '.codes'] = numpy.array(
+            [-1 if v is None else index[str(v)] for v in values], dtype='<i4')
+        buffers[col + '.offsets'], buffers[col + '.data'] = _string_pool(labels)
+
+    for col, separator in STRING_COLUMNS.items():
+        values = []
+        for f in forms:
+            value = f.get(col)
+            if value is None:
+                value = ''
+            elif separator is not None and isinstance(value, (list, tuple)):
+                value = separator.join(value)
+            values.append(value)
+        buffers[col + '.offsets'], buffers[col + '.data'] = _string_pool(values)
+
+    header, offset = {'rows': len(forms), 'buffers': {}}, 0
+    for name, array in buffers.items():
+        header['buffers'][name] = [array.dtype.str, offset, len(array)]
+        offset += _aligned(array.nbytes)
+    header = json.dumps(header).encode('utf8')
+
+    with open(filename, 'wb') as handle:
+        handle.write(COLUMNS_MAGIC)
+        handle.write(struct.pack('<Q', len(header)))
+        handle.write(header.ljust(_aligned(len(header)), b' '))
+        for array in buffers.values():
+            handle.write(array.tobytes().ljust(_aligned(array.nbytes), b'\0'))
+
+
+class StringColumn(object):
+    """A column of strings decoded lazily from a memory-mapped string pool."""
+    def __init__(self, offsets, data):
+        self.offsets, self.data = offsets, data
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.data[self.offsets[i]:self.offsets[i + 1]].tobytes().decode('utf8')
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+class ColumnarForms(object):
+    """
+    Read-only view of a file written by `write_columns`.
+
+    The buffers are numpy arrays over a memory map of the file, so loading
+    is zero-copy: `codes` returns the int32 codes of a dictionary column,
+    `labels` its distinct labels and `forms[col]` the per-row strings.
+
+    >>> forms = ColumnarForms('cldf/forms.bin')
+    >>> forms.labels('Language_ID')[forms.codes('Language_ID')[0]]
+    'amharic'
+    """
+    def __init__(self, filename):
+        with open(filename, 'rb') as handle:
+            self._mmap = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(COLUMNS_MAGIC)] != COLUMNS_MAGIC:
+            raise ValueError("%s is not a columnar forms file" % filename)
+        size = struct.unpack('<Q', self._mmap[8:16])[0]
+        header = json.loads(self._mmap[16:16 + size].decode('utf8'))
+        start = _aligned(16 + size)
+        self.rows = header['rows']
+        self.buffers = {
+            name: numpy.frombuffer(self._mmap, dtype=dtype, count=count, offset=start + offset)
+            for name, (dtype, offset, count) in header['buffers'].items()}
+
+    def __len__(self):
+        return self.rows
+
+    def __getitem__(self, col):
+        if col in DICTIONARY_COLUMNS:
+            labels = self.labels(col)
+            return [None if c < 0 else labels[c] for c in self.codes(col)]
+        return StringColumn(self.buffers[col + '.offsets'], self.buffers[col + '.data'])
+
+    def codes(self, col):
+        return self.buffers[col + '.codes']
+
+    def labels(self, col):
+        return StringColumn(self.buffers[col + '.offsets'], self.buffers[col + '.data'])
+
+
+# bump when the schema of the SQLite export changes
+SQLITE_VERSION = 2
+
+SQLITE_TABLES = {
+    'forms': 'FormTable',
+    'languages': 'LanguageTable',
+    'parameters': 'ParameterTable',
+}
+
+# columns added to the CLDF columns: the paradigm file of a form, and the
+# directory of raw/ (i.e. the family) of a language's paradigm file
+SQLITE_EXTRA_COLUMNS = {
+    'forms': 'file',
+    'languages': 'directory',
+}
+
+SQLITE_INDEXES = {
+    'forms': ['Language_ID', 'Parameter_ID', 'Paradigm_ID', 'file'],
+    'languages': ['Glottocode', 'Family', 'Analect', 'directory'],
+    'parameters': ['Person', 'GrammaticalNumber', 'Alignment'],
+}
 
 
+def _sql_value(value, separator):
+    if isinstance(value, (list, tuple)):
+        return (separator or ' ').join(str(v) for v in value)
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+class SQLiteExport(object):
+    """
+    Indexed SQLite copy of the forms, languages and parameters of a build,
+    updated per paradigm file rather than recreated.
+
+    Each form records the paradigm file it came from, and a file's forms are
+    only deleted and re-inserted when the hash of its rows changes, so a
+    build that changed a few files only rewrites their rows. Forms of files
+    which are gone are deleted. Languages and parameters are small and are
+    replaced in every build. Each language records the directory of raw/
+    (i.e. the family) its paradigm file is in, as Family is only filled
+    from Glottolog. The database is recreated if SQLITE_VERSION or the CLDF
+    columns change.
+
+    Changes are committed in one transaction by `finish`, and the database is
+    in WAL mode so readers are not blocked while a build writes.
+    """
+    def __init__(self, filename, cldf):
+        self.filename = Path(filename)
+        self.columns = {
+            name: [c for c in cldf[table].tableSchema.columns if not c.virtual]
+            for name, table in SQLITE_TABLES.items()}
+        self.updated, self.seen = 0, set()
+        self.db = sqlite3.connect(str(self.filename))
+        self.db.execute('PRAGMA journal_mode=WAL')
+
+        schema = json.dumps(
+            [SQLITE_VERSION, {n: [c.header for c in cols] for n, cols in self.columns.items()}])
+        try:
+            current = self.db.execute("SELECT value FROM meta WHERE key = 'schema'").fetchone()
+        except sqlite3.OperationalError:
+            current = None
+        if current != (schema,):
+            self.create(schema)
+        self.hashes = dict(self.db.execute('SELECT file, hash FROM files'))
+
+    def create(self, schema):
+        for name in list(SQLITE_TABLES) + ['files', 'meta']:
+            self.db.execute('DROP TABLE IF EXISTS %s' % name)
+        self.db.execute('CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)')
+        self.db.execute('CREATE TABLE files (file TEXT PRIMARY KEY, hash TEXT)')
+        for name, columns in self.columns.items():
+            self.db.execute('CREATE TABLE %s (%s%s)' % (
+                name,
+                ', '.join(
+                    '"%s"%s' % (c.header, ' PRIMARY KEY' if c.header == 'ID' else '')
+                    for c in columns),
+                ', %s TEXT' % SQLITE_EXTRA_COLUMNS[name] if name in SQLITE_EXTRA_COLUMNS else ''))
+            for column in SQLITE_INDEXES[name]:
+                self.db.execute(
+                    'CREATE INDEX %s_%s ON %s ("%s")' % (name, column, name, column))
+        self.db.execute("INSERT INTO meta VALUES ('schema', ?)", (schema,))
+        self.db.commit()
+
+    def rows(self, name, items):
+        return [
+            [_sql_value(item.get(c.header), c.separator) for c in self.columns[name]]
+            for item in items]
+
+    def insert(self, name, rows):
+        """Inserts `rows`, which end with the value of the table's extra column if it has one."""
+        self.db.executemany('INSERT OR REPLACE INTO %s VALUES (%s)' % (
+            name, ', '.join('?' * (len(self.columns[name]) + (name in SQLITE_EXTRA_COLUMNS)))),
+            rows)
+
+    def update(self, key, forms):
+        """Replaces the forms of the paradigm file `key` if they changed."""
+        rows = self.rows('forms', forms)
+        digest = hashlib.sha1(json.dumps(rows).encode('utf8')).hexdigest()
+        self.seen.add(key)
+        if self.hashes.get(key) != digest:
+            self.db.execute('DELETE FROM forms WHERE file = ?', (key,))
+            self.insert('forms', [row + [key] for row in rows])
+            self.db.execute('INSERT OR REPLACE INTO files VALUES (?, ?)', (key, digest))
+            self.updated += 1
+
+    def finish(self, languages, parameters, directories=None):
+        """
+        Deletes the forms of files not seen, replaces the languages (with the
+        directory of their Filename from the dict `directories`, filename ->
+        directory of raw/) and parameters and commits.
+        """
+        directories = directories or {}
+        for key in set(self.hashes) - self.seen:
+            self.db.execute('DELETE FROM forms WHERE file = ?', (key,))
+            self.db.execute('DELETE FROM files WHERE file = ?', (key,))
+        self.db.execute('DELETE FROM languages')
+        self.insert('languages', [
+            row + [directories.get(item.get('Filename'))]
+            for item, row in zip(languages, self.rows('languages', languages))])
+        self.db.execute('DELETE FROM parameters')
+        self.insert('parameters', self.rows('parameters', parameters))
+        self.db.commit()
+        self.db.execute('ANALYZE')
+        self.db.close()
+        return self.updated, len(set(self.hashes) - self.seen)
+
+
+def select_forms(db, **attributes):
+    """
+    Returns the forms, as dicts, matching `attributes`, which are columns of
+    the forms, languages or parameters tables of a database written by
+    `SQLiteExport` (looked up in that order; `table__column` to be explicit).
+
+    >>> db = sqlite3.connect('pronouns.sqlite')
+    >>> forms = select_forms(db, Person='12', GrammaticalNumber='pl', directory='Austronesian', Analect='Bound')
+    """
+    columns = {
+        name: [r[1] for r in db.execute('PRAGMA table_info(%s)' % name)]
+        for name in SQLITE_TABLES}
+    conditions, values = [], []
+    for attribute, value in attributes.items():
+        table, _, column = attribute.rpartition('__')
+        table = table or next((t for t in SQLITE_TABLES if column in columns[t]), None)
+        if column not in columns.get(table, []):
+            raise ValueError("Unknown column %r" % attribute)
+        conditions.append('%s."%s" = ?' % (table, column))
+        values.append(value)
+    cursor = db.execute(
+        'SELECT forms.* FROM forms '
+        'JOIN languages ON languages.ID = forms.Language_ID '
+        'JOIN parameters ON parameters.ID = forms.Parameter_ID' +
+        (' WHERE ' + ' AND '.join(conditions) if conditions else '') +
+        ' ORDER BY forms.rowid', values)
+    names = [d[0] for d in cursor.description]
+    return [dict(zip(names, row)) for row in cursor]
+
+
+class ParadigmMatrix(object):
+    """
+    Paradigms (rows) by pronoun parameters (columns) as a dense matrix.
+
+    Each cell holds an integer code for the set of forms attested for that
+    paradigm and parameter, so equal codes mean identical (syncretic)
+    cells. Cells without data are MISSING, and the `missing`, `unknown`
+    ('?') and `zero` ('∅') masks flag the special cells.
+
+    >>> m = ParadigmMatrix.from_cldf()
+    >>> m.where(m.syncretic('1sg_s', '1sg_a'))[:3]
+    ['nen', 'kayardild', 'lardil']
+    """
+    MISSING = -1
+
+    def __init__(self, paradigms, parameters, cells):
+        """
+        :param paradigms: list of paradigm (language) IDs, one per row.
+        :param parameters: list of dicts describing the parameters, with `ID` \
+        and the `PronounConcept` attributes, one per column.
+        :param cells: iterable of (paradigm ID, parameter ID, form) triples.
+        """
+        self.paradigms = list(paradigms)
+        self.parameters = list(parameters)
+        self.rows = {p: i for i, p in enumerate(self.paradigms)}
+        self.columns = {p['ID']: j for j, p in enumerate(self.parameters)}
+
+        forms = defaultdict(set)
+        for paradigm, parameter, form in cells:
+            if paradigm in self.rows and parameter in self.columns:
+                forms[(self.rows[paradigm], self.columns[parameter])].add(form)
+
+        self.forms = {}  # tuple of forms -> code
+        self.codes = numpy.full((len(self.paradigms), len(self.parameters)), self.MISSING, dtype='i4')
+        for (i, j), cell in forms.items():
+            self.codes[i, j] = self.forms.setdefault(tuple(sorted(cell)), len(self.forms))
+
+        self.labels = sorted(self.forms, key=self.forms.get)
+        self.missing = self.codes == self.MISSING
+        self.unknown = self._is(('?',))
+        self.zero = self._is(('∅',))
+
+    def _is(self, forms):
+        if forms in self.forms:
+            return self.codes == self.forms[forms]
+        return numpy.zeros(self.codes.shape, dtype=bool)
+
+    @classmethod
+    def from_cldf(cls, cldf_dir=None, column='Form'):
+        """
+        Reads the matrix from the CLDF dataset. With `column='Segments'`
+        cells hold the space-separated segments instead of the forms.
+        """
+        cldf_dir = Path(cldf_dir or Path(__file__).parent / 'cldf')
+
+        def read(name):
+            with csvw.UnicodeDictReader(cldf_dir / name) as reader:
+                return list(reader)
+
+        return cls(
+            [r['ID'] for r in read('languages.csv')],
+            read('parameters.csv'),
+            ((r['Language_ID'], r['Parameter_ID'], r[column]) for r in read('forms.csv')))
+
+    def valid(self, include_zero=True):
+        """Returns the mask of cells with a comparable form."""
+        mask = ~(self.missing | self.unknown)
+        return mask if include_zero else mask & ~self.zero
+
+    def column(self, parameter):
+        return self.codes[:, self.columns[parameter]]
+
+    def cell(self, paradigm, parameter):
+        """Returns the forms in a cell, or None if there are none."""
+        code = self.codes[self.rows[paradigm], self.columns[parameter]]
+        return None if code == self.MISSING else self.labels[code]
+
+    def where(self, mask):
+        """Returns the IDs of the paradigms selected by a boolean row `mask`."""
+        return [self.paradigms[i] for i in numpy.flatnonzero(mask)]
+
+    def select(self, **attributes):
+        """Returns the IDs of the parameters with the given concept attributes."""
+        return [
+            p['ID'] for p in self.parameters
+            if all(p.get(k) == v for k, v in attributes.items())]
+
+    def syncretic(self, a, b, include_zero=True):
+        """Returns a row mask of the paradigms in which parameters `a` and `b` share their forms."""
+        i, j = self.columns[a], self.columns[b]
+        valid = self.valid(include_zero)
+        return valid[:, i] & valid[:, j] & (self.codes[:, i] == self.codes[:, j])
+
+    def equal(self, a, b, include_zero=True, how='all'):
+        """
+        Returns a row mask of the paradigms in which the parameters matching
+        the attributes in `a` have the same forms as their counterparts
+        matching `b`, e.g. `equal(dict(Person='3', GrammaticalNumber='pl'),
+        dict(Person='3', GrammaticalNumber='sg'))`. Counterparts agree on all
+        attributes not given in `a` or `b`. With `how='all'` a paradigm needs
+        at least one attested pair and all attested pairs must be equal, with
+        `how='any'` one equal pair is enough.
+        """
+        if how not in ('all', 'any'):
+            raise ValueError("how must be 'all' or 'any', got %r" % (how,))
+        keys = set(a) | set(b) | {'ID', 'Name', 'English', 'LocalID', 'Sequence',
+                                  'Concepticon_ID', 'Concepticon_Gloss'}
+
+        def signature(p):
+            return tuple(sorted((k, v) for k, v in p.items() if k not in keys))
+
+        counterparts = {
+            signature(p): p['ID'] for p in self.parameters
+            if all(p.get(k) == v for k, v in b.items())}
+        valid = self.valid(include_zero)
+        attested = numpy.zeros(len(self.paradigms), dtype=bool)
+        same = numpy.zeros(len(self.paradigms), dtype=bool)
+        differs = numpy.zeros(len(self.paradigms), dtype=bool)
+        for p in self.parameters:
+            if all(p.get(k) == v for k, v in a.items()) and signature(p) in counterparts:
+                i, j = self.columns[p['ID']], self.columns[counterparts[signature(p)]]
+                both = valid[:, i] & valid[:, j]
+                attested |= both
+                same |= both & (self.codes[:, i] == self.codes[:, j])
+                differs |= both & (self.codes[:, i] != self.codes[:, j])
+        return (attested & ~differs) if how == 'all' else same
+
+    def syncretism(self, include_zero=True):
+        """
+        Returns a parameters x parameters matrix counting the paradigms in
+        which each pair of cells shares its forms.
+        """
+        valid = self.valid(include_zero)
+        counts = numpy.zeros((len(self.parameters), len(self.parameters)), dtype='i8')
+        for j in range(len(self.parameters)):
+            same = (self.codes == self.codes[:, j:j + 1]) & valid & valid[:, j:j + 1]
+            counts[j] = same.sum(axis=0)
+        return counts
+
+
+def _encode(sequences, vocabulary):
+    lengths = numpy.array([len(s) for s in sequences], dtype='i4')
+    encoded = numpy.full((len(sequences), max(lengths.max(initial=0), 1)), -1, dtype='i4')
+    for i, s in enumerate(sequences):
+        encoded[i, :len(s)] = [vocabulary.setdefault(t, len(vocabulary)) for t in s]
+    return encoded, lengths
+
+
+def _edit_distances(a, la, b, lb):
+    # Levenshtein DP run for all pairs at once: row i of the DP table is
+    # computed for every pair, and a pair's distance is read off once i
+    # reaches its length. Padding never influences the cells we read.
+    previous = numpy.tile(numpy.arange(b.shape[1] + 1, dtype='i4'), (len(a), 1))
+    result = lb.copy()
+    for i in range(1, a.shape[1] + 1):
+        current = numpy.empty_like(previous)
+        current[:, 0] = i
+        cost = (a[:, i - 1:i] != b).astype('i4')
+        current[:, 1:] = numpy.minimum(previous[:, :-1] + cost, previous[:, 1:] + 1)
+        for j in range(1, b.shape[1] + 1):
+            numpy.minimum(current[:, j], current[:, j - 1] + 1, out=current[:, j])
+        done = la == i
+        result[done] = current[done, lb[done]]
+        previous = current
+    return result / numpy.maximum(numpy.maximum(la, lb), 1)
+
+
+def edit_distances(a, b):
+    """
+    Returns the Levenshtein distances between a[i] and b[i], normalised by
+    the length of the longer sequence, for all i at once. Sequences are
+    strings or tuples of segments.
+    """
+    vocabulary = {}
+    return _edit_distances(*_encode(a, vocabulary), *_encode(b, vocabulary))
+
+
+def cell_distances(cells, segmented=False, block=2 ** 15):
+    """
+    Returns the matrix of distances between the `cells` (tuples of forms)
+    of one parameter: the smallest normalised edit distance between any of
+    their forms.
+    """
+    forms = sorted({f for cell in cells for f in cell})
+    index = {f: i for i, f in enumerate(forms)}
+    encoded, lengths = _encode([tuple(f.split()) if segmented else f for f in forms], {})
+
+    distances = numpy.zeros((len(forms), len(forms)), dtype='f4')
+    i, j = numpy.triu_indices(len(forms), 1)
+    # blocks of pairs of similar length keep the padding small
+    order = numpy.argsort(numpy.maximum(lengths[i], lengths[j]), kind='stable')
+    for start in range(0, len(order), block):
+        x, y = i[order[start:start + block]], j[order[start:start + block]]
+        width = max(lengths[x].max(), lengths[y].max(), 1)
+        d = _edit_distances(encoded[x, :width], lengths[x], encoded[y, :width], lengths[y])
+        distances[x, y] = distances[y, x] = d
+
+    # reduce form x form distances to cell x cell
+    members = [[index[f] for f in cell] for cell in cells]
+    nearest = numpy.stack([distances[m].min(axis=0) for m in members]) if cells else distances
+    return numpy.stack([nearest[:, m].min(axis=1) for m in members]) if cells else distances
+
+
+class ParadigmSimilarity(object):
+    """
+    All-pairs distances between the paradigms of a `ParadigmMatrix`, computed
+    in blocks of `block` paradigms:
+
+    - `syncretism_distances`: the share of parameter pairs attested in both
+      paradigms on which they disagree about being syncretic.
+    - `form_distances`: the mean normalised edit distance between the cells
+      of the parameters attested in both paradigms.
+
+    Distances are NaN for paradigms without shared parameters. The per-parameter
+    edit distances are spread over `processes` worker processes if more than one.
+    """
+    def __init__(self, matrix, block=256, processes=1, segmented=False):
+        self.matrix = matrix
+        self.block = block
+        self.processes = processes
+        self.segmented = segmented
+
+    def _blocks(self):
+        for start in range(0, len(self.matrix.paradigms), self.block):
+            yield slice(start, start + self.block)
+
+    def syncretism_distances(self):
+        m = self.matrix
+        valid = m.valid()
+        i, j = numpy.triu_indices(len(m.parameters), 1)
+        defined = (valid[:, i] & valid[:, j]).astype('f4')
+        same = (defined > 0) & (m.codes[:, i] == m.codes[:, j])
+        same = same.astype('f4')
+        different = defined - same
+
+        distances = numpy.empty((len(m.paradigms), len(m.paradigms)), dtype='f4')
+        for rows in self._blocks():
+            agree = same[rows] @ same.T + different[rows] @ different.T
+            joint = defined[rows] @ defined.T
+            with numpy.errstate(invalid='ignore', divide='ignore'):
+                distances[rows] = 1 - agree / joint
+        return distances
+
+    def form_distances(self):
+        m = self.matrix
+        columns = []
+        for j in range(len(m.parameters)):
+            codes = numpy.unique(m.codes[:, j][m.valid()[:, j]])
+            columns.append((j, codes))
+
+        cells = [[m.labels[c] for c in codes] for _, codes in columns]
+        worker = functools.partial(cell_distances, segmented=self.segmented)
+        if self.processes > 1:
+            with multiprocessing.Pool(self.processes) as pool:
+                matrices = pool.map(worker, cells, chunksize=1)
+        else:
+            matrices = [worker(c) for c in cells]
+
+        total = numpy.zeros((len(m.paradigms), len(m.paradigms)), dtype='f4')
+        count = numpy.zeros((len(m.paradigms), len(m.paradigms)), dtype='i4')
+        valid = m.valid()
+        for (j, codes), distances in zip(columns, matrices):
+            if not len(codes):
+                continue
+            local = numpy.searchsorted(codes, numpy.maximum(m.codes[:, j], 0))
+            local = numpy.minimum(local, len(codes) - 1)
+            for rows in self._blocks():
+                both = valid[rows, j][:, None] & valid[:, j][None, :]
+                d = distances[local[rows]][:, local]
+                total[rows] += numpy.where(both, d, 0)
+                count[rows] += both
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            return total / count
+
+    def distances(self, weight=0.5):
+        """Returns `weight` * syncretism distance + (1 - `weight`) * form distance."""
+        return weight * self.syncretism_distances() + (1 - weight) * self.form_distances()
+
+    def neighbours(self, k=5, distances=None):
+        """
+        Returns {paradigm: [(paradigm, distance), ...]} with the `k` nearest
+        neighbours of each paradigm.
+        """
+        distances = self.distances() if distances is None else distances.copy()
+        distances = numpy.where(numpy.isnan(distances), numpy.inf, distances)
+        numpy.fill_diagonal(distances, numpy.inf)
+        k = min(k, len(self.matrix.paradigms) - 1)
+        nearest = numpy.argsort(distances, axis=1, kind='stable')[:, :k]
+        return {
+            p: [(self.matrix.paradigms[j], float(distances[i, j]))
+                for j in nearest[i] if numpy.isfinite(distances[i, j])]
+            for i, p in enumerate(self.matrix.paradigms)}
+
 
 class Dataset(pylexibank.Dataset):
     dir = Path(__file__).parent
@@ -76,6 +1019,9 @@ class Dataset(pylexibank.Dataset):
     concept_class = PronounConcept
     lexeme_class = PronounLexeme
 
+    form_cache = None  # a FormCache, set up in cmd_makecldf
+    profile = None  # a BuildProfile, set up in _cmd_makecldf
+
     # define the way in which forms should be handled
     form_spec = pylexibank.FormSpec(
         brackets={"(": ")"},        # characters that function as brackets
@@ -86,7 +1032,41 @@ class Dataset(pylexibank.Dataset):
 
     def cmd_download(self, args):
         pass
-        
+
+    def _cmd_makecldf(self, args):
+        # set PRONOUNS_PROFILE to time the stages of the build and write a
+        # report to .cache/profile.json, and PRONOUNS_PROFILE_DUMP to also
+        # dump cProfile statistics to that file.
+        self.profile = BuildProfile(enabled=flag('profile') or bool(option('profile_dump')))
+        profiler = cProfile.Profile() if option('profile_dump') else None
+        if profiler:
+            profiler.enable()
+        try:
+            with self.profile.stage('makecldf'):
+                super()._cmd_makecldf(args)
+        finally:
+            if profiler:
+                profiler.disable()
+                profiler.dump_stats(option('profile_dump'))
+                logging.info("cProfile statistics written to %s" % option('profile_dump'))
+            if self.profile.enabled:
+                self.write_profile()
+
+    def write_profile(self):
+        report = self.profile.report()
+        filename = self.dir / '.cache' / 'profile.json'
+        filename.parent.mkdir(exist_ok=True)
+        filename.write_text(json.dumps(report, indent=2), encoding='utf8')
+
+        for name, stage in sorted(report['stages'].items(), key=lambda i: -i[1]['wall']):
+            logging.info("profile: %-16s %8.3fs wall %8.3fs cpu %8d calls" % (
+                name, stage['wall'], stage['cpu'], stage['calls']))
+        logging.info("profile: %d rows from %d files, %s rows/s, peak memory %s KiB" % (
+            report['rows'], report['files'], report['rows_per_second'], report['peak_memory_kib']))
+        for kind, count in sorted(report['warnings'].items()):
+            logging.info("profile: %d %s warnings" % (count, kind))
+        logging.info("profile: report written to %s" % filename)
+
     def cmd_makecldf(self, args):
         """
         Convert the raw data to a CLDF dataset.
@@ -94,41 +1074,219 @@ class Dataset(pylexibank.Dataset):
         A `pylexibank.cldf.LexibankWriter` instance is available as `args.writer`. Use the methods
         of this object to add data.
         """
-        
-        args.writer.add_sources()
-        
-        languages = args.writer.add_languages(
-            lookup_factory=lambda x: x['Filename']
-        )
-        
-        # get paradigm IDs
-        paradigms = {
-            r['ID']: r['LocalID'] for r in self.etc_dir.read_csv('languages.tsv', delimiter="\t", dicts=True)
-        }
-        
-        concepts = args.writer.add_concepts(id_factory="id")
+        if self.profile is None:
+            self.profile = BuildProfile(enabled=False)
+        profile = self.profile
+        if profile.enabled:
+            args.writer.tokenize = profile.wrap('segment', args.writer.tokenize)
+            args.writer.write = profile.wrap('write', args.writer.write)
+
+        # set PRONOUNS_STREAM to write forms.csv as the forms are added rather
+        # than keeping all forms in memory until the end
+        if flag('stream'):
+            stream = FormStream(args.writer.cldf['FormTable'])
+            args.writer.objects['FormTable'] = stream
+            args.writer.write = stream.wrap(args.writer.write)
+
+        with profile.stage('add_languages'):
+            args.writer.add_languages()
+            # the filename, paradigm and glottocode indexes of the rows of
+            # etc/languages.tsv just added, shared with the checker
+            registry = LanguageRegistry(self.languages, self.raw_dir)
+        for problem in registry.check():
+            profile.warn('glottocode', "WARNING: etc/languages.tsv: %s" % problem)
+
+        with profile.stage('add_concepts'):
+            concepts = args.writer.add_concepts(id_factory="id")
 
         filenames = list(sorted(self.raw_dir.glob("*/*.csv")))
         logging.info("%d files found" % len(filenames))
-        for language, glottocode, filename, record in progressbar(read_text_files(filenames)):
-            if filename not in languages:
-                logging.warn("WARNING: Unknown language filename '%s' - add details to ./etc/languages.tsv" % filename)
-            
+
+        # a hash of everything splitting and segmentation depend on
+        profiles = sorted(self.etc_dir.glob('orthography.tsv')) + \
+            sorted(self.etc_dir.glob('orthography/*.tsv'))
+        namespace = hashlib.sha1(json.dumps([
+            BUILD_VERSION,
+            repr(self.form_spec),
+            list(self.lexemes.items()),
+            list(self.segments.items()),
+            [(p.name, file_hash(p)) for p in profiles],
+        ]).encode('utf8')).hexdigest()
+
+        # with PRONOUNS_INCREMENTAL set, reuse the forms of unchanged files
+        # from the previous build.
+        manifest = BuildManifest(
+            self.dir / '.cache' / 'makecldf.json',
+            dependencies={
+                'forms': namespace,
+                'languages.tsv': file_hash(self.etc_dir / 'languages.tsv'),
+                'concepts.tsv': file_hash(self.etc_dir / 'concepts.tsv'),
+            },
+            sources=self.raw_dir / 'sources.bib',
+            load=flag('incremental'))
+        incremental = flag('incremental')
+
+        # set PRONOUNS_CHECK to run checker.py on the files as they are
+        # parsed. The errors of reused files are those recorded when they
+        # were checked.
+        checker = None
+        if flag('check'):
+            sys.path.insert(0, str(self.dir))
+            from checker import Checker, Context
+            context = Context(self.etc_dir, self.raw_dir, cache_dir=self.dir / '.cache')
+            context.languages = registry
+            checker = functools.partial(Checker, context=context.load())
+
+        digests = {f: file_hash(f) for f in filenames}
+        cached = {
+            f: manifest.get(f.relative_to(self.raw_dir).as_posix(), digests[f], checked=bool(checker))
+            for f in filenames} if incremental else {}
+
+        # split and segmented values are cached in .cache/forms.json. Set
+        # PRONOUNS_FORM_CACHE_SIZE to bound the number of values kept (0 to
+        # disable the cache).
+        self.form_cache = FormCache(
+            self.dir / '.cache' / 'forms.json',
+            namespace=namespace,
+            size=int(option('form_cache_size', 100000)),
+            profiles=[p.stem for p in profiles if p.parent.name == 'orthography'])
+
+        # set PRONOUNS_PROCESSES to parse and split the changed files in
+        # parallel; records come back in filename order. Serial builds
+        # only split values which are not in the form cache.
+        processes = int(option('processes', 1))
+        parsed = iter_text_files(
+            [f for f in filenames if cached.get(f) is None],
+            processes=processes,
+            form_spec=self.form_spec if processes > 1 or not self.form_cache else None,
+            lexemes=self.lexemes,
+            checker=checker)
+
+        # set PRONOUNS_SQLITE to keep an indexed SQLite copy of the forms,
+        # languages and parameters in pronouns.sqlite, updated per changed
+        # paradigm file (the cldf directory is cleaned by every build)
+        export = None
+        if flag('sqlite'):
+            export = SQLiteExport(self.dir / 'pronouns.sqlite', args.writer.cldf)
+
+        reused, errors = 0, 0
+        for filename in progressbar(filenames):
+            start = time.perf_counter()
+            entry = cached.get(filename)
+            if entry is None:
+                with profile.stage('read'):
+                    _, records, problems = next(parsed)
+                with profile.stage('add_forms'):
+                    lexemes, warnings = self.add_forms_from_records(
+                        args.writer, filename, records, registry, concepts)
+                forms = [{k: v for k, v in lex.items() if k != 'ID' and v is not None} for lex in lexemes]
+            else:
+                forms, problems = entry['forms'], entry.get('errors', [])
+                warnings = entry.get('warnings', [])
+                with profile.stage('add_cached_forms'):
+                    lexemes = self.add_cached_forms(args.writer, forms)
+                reused += 1
+            # the warnings of reused files are those recorded when they were read
+            for kind, message in warnings:
+                profile.warn(kind, message)
+            for problem in problems:
+                profile.warn('check', "CHECK: %s: %s" % (filename.relative_to(self.raw_dir), problem))
+            errors += len(problems)
+            key = filename.relative_to(self.raw_dir).as_posix()
+            if profile.enabled:
+                profile.file(key, len(forms), time.perf_counter() - start)
+            manifest.update(key, digests[filename], forms, problems if checker else None, warnings)
+            if export:
+                with profile.stage('sqlite'):
+                    export.update(key, lexemes)
+
+        if incremental:
+            logging.info("%d/%d files reused from previous build" % (reused, len(filenames)))
+        if checker:
+            logging.info("%d errors found by checker.py" % errors)
+        with profile.stage('write_caches'):
+            manifest.write()
+            if self.form_cache:
+                logging.info("form cache: %d hits, %d misses" % (self.form_cache.hits, self.form_cache.misses))
+                self.form_cache.write()
+
+        if export:
+            with profile.stage('sqlite'):
+                updated, removed = export.finish(
+                    args.writer.objects['LanguageTable'], args.writer.objects['ParameterTable'],
+                    {f.name: f.parent.name for f in filenames})
+            logging.info("pronouns.sqlite: forms of %d files updated, %d removed" % (updated, removed))
+
+        # raw/sources.bib is read through an index kept in .cache/, so only
+        # entries changed since the last build are parsed. Set
+        # PRONOUNS_CITED_SOURCES to only add the sources cited by forms.
+        with profile.stage('add_sources'):
+            keys, forms = None, args.writer.objects['FormTable']
+            if flag('cited_sources'):
+                keys = forms.sources if isinstance(forms, FormStream) else cited_sources(forms)
+            sources = BibIndex(self.raw_dir / 'sources.bib', self.dir / '.cache' / 'sources.json').sources(keys)
+            if sources:
+                args.writer.add_sources(*sources)
+
+        # set PRONOUNS_COLUMNS to also write the forms in columnar form
+        if flag('columns'):
+            with profile.stage('write_columns'):
+                forms = args.writer.objects['FormTable']
+                if isinstance(forms, FormStream):  # read the streamed forms back once
+                    forms = list(forms)
+                write_columns(self.cldf_dir / 'forms.bin', forms)
+
+    def add_forms_from_records(self, writer, filename, records, registry, concepts):
+        """
+        Adds the forms of the paradigm file `filename`, returning them and the
+        warnings about the file as (kind, message) pairs for
+        `BuildProfile.warn`. The language is looked up in the
+        `LanguageRegistry` once per file.
+        """
+        forms, warnings = [], []
+        lang_id = registry.ids.get(filename.name)
+        if lang_id is None:
+            if records:
+                warnings.append(('unknown-filename', "WARNING: Unknown language filename '%s' - add details to ./etc/languages.tsv" % filename.name))
+            lang_id = slug(get_language(filename.stem)[0])
+        paradigm = registry.paradigms.get(lang_id)
+
+        for language, glottocode, _, record, *split in records:
             if record['parameter'] not in concepts:
-                logging.warn("WARNING: Unknown parameter %s: %r" % (filename, record['parameter']))
+                warnings.append(('unknown-parameter', "WARNING: Unknown parameter %s: %r" % (filename.name, record['parameter'])))
                 continue
-            
-            lang_id = languages.get(filename, slug(language))
-            
-            value = record['word']
-            if value in ('-', '#'):
-                value = '∅'
-            
-            lex = args.writer.add_forms_from_value(
+
+            kw = dict(
                 Language_ID=lang_id,
                 Parameter_ID=record['parameter'],
-                Value=value,
+                Value=get_value(record),
                 Source=record['source'],
                 Comment=record['comment'],
-                Paradigm_ID=paradigms.get(lang_id)
+                Paradigm_ID=paradigm
             )
+            hit = self.form_cache.get(kw['Value'], lang_id) if self.form_cache else None
+            if hit is not None:
+                lexemes = self.add_cached_forms(writer, [dict(kw, **form) for form in hit])
+            else:
+                if not split:
+                    with self.profile.stage('split'):
+                        split = [self.form_spec.split(record, kw['Value'], lexemes=self.lexemes)]
+                lexemes = writer.add_forms_from_value(
+                    split_value=lambda item, value: split[0], **kw)
+                if self.form_cache:
+                    self.form_cache.put(kw['Value'], lexemes, lang_id)
+            forms.extend(lexemes)
+        return forms, warnings
+
+    def add_cached_forms(self, writer, forms):
+        """
+        Re-adds forms from the build manifest or form cache without splitting
+        or segmenting them again.
+        """
+        lexemes = []
+        for kw in forms:
+            kw = dict(kw, ID=writer.lexeme_id(kw))
+            if kw.get('Segments'):
+                writer.analyze_segments(kw)
+            lexemes.append(writer._add_object(self.lexeme_class, **kw))
+        return lexemes
@@ -1,31 +1,136 @@
 #!/usr/bin/env python3
 # coding=utf-8
 """Appends source information to txt files"""
-import csvw
+import os
+import sys
 import shutil
+import difflib
+import tempfile
+import multiprocessing
+from pathlib import Path
+
+import csvw
+
+RAW_DIR = Path(__file__).parent
+REPO = RAW_DIR.parent
+
+
+def add_source(filename, source, dry_run=False):
+    """
+    Sets the source of the rows of `filename` without one to `source`,
+    streaming the rows through a temporary file which then replaces
+    `filename`. Returns (filename, rows changed, messages, diff); with
+    `dry_run` the file is left unchanged and the diff shows what would change.
+    """
+    filename = Path(filename)
+    changed, messages = 0, []
+    handle, tmp = tempfile.mkstemp(dir=filename.parent, prefix=".%s." % filename.stem, suffix='.tmp')
+    os.close(handle)
+    try:
+        with csvw.UnicodeDictReader(filename, delimiter=',') as reader, \
+                csvw.UnicodeWriter(tmp, delimiter=",") as writer:
+            # written before the rows, so a file without rows keeps its header
+            header = reader.fieldnames or []
+            if header:
+                writer.writerow(header)
+            for i, row in enumerate(reader, 1):
+                if row['source']:
+                    messages.append('Skipping line %d - already has content: %r' % (i, row['source']))
+                else:
+                    row['source'] = source
+                    changed += 1
+                writer.writerow([row[h] for h in header])
+
+        diff = []
+        if dry_run:
+            with open(filename, encoding='utf8') as old, open(tmp, encoding='utf8') as new:
+                diff = list(difflib.unified_diff(
+                    old.read().splitlines(), new.read().splitlines(),
+                    fromfile=str(filename), tofile=str(filename), lineterm=''))
+        else:
+            shutil.copymode(filename, tmp)
+            os.replace(tmp, filename)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return filename, changed, messages, diff
+
+
+def _add_source(task):
+    return add_source(*task)
+
+
+def read_mapping(filename, raw_dir=RAW_DIR):
+    """
+    Reads a TSV file with columns `Pattern` and `Source`, mapping a glob of
+    files in raw/ (e.g. `Uralic/*.csv`) or a glottocode to a source key (or
+    several, separated by `;`). Returns ({file: source}, problems).
+    """
+    files = sorted(raw_dir.glob('*/*.csv'))
+    mapping, problems = {}, []
+    with csvw.UnicodeDictReader(filename, delimiter="\t") as reader:
+        for i, row in enumerate(reader, 2):
+            pattern, source = row['Pattern'].strip(), row['Source'].strip()
+            if any(c in pattern for c in '*?[/.'):
+                matches = sorted(raw_dir.glob(pattern))
+            else:
+                matches = [f for f in files if f.stem.split(" ")[-1] == pattern]
+            if not matches:
+                problems.append("L%d - no files match '%s'" % (i, pattern))
+            for f in matches:
+                if mapping.get(f, source) != source:
+                    problems.append("L%d - %s is already mapped to '%s'" % (i, f, mapping[f]))
+                mapping[f] = source
+    return mapping, problems
+
+
+def validate(mapping, bib=RAW_DIR / 'sources.bib'):
+    """Returns problems with the source keys in `mapping` that are not in `bib`."""
+    sys.path.insert(0, str(REPO))
+    from bibindex import BibIndex
+
+    index = BibIndex(bib, REPO / '.cache' / 'sources.json')
+    known = set(index.keys()) | {'UNKNOWN'}
+    return [
+        "unknown source '%s' for %s" % (key, f)
+        for f, source in sorted(mapping.items())
+        for key in source.split(';') if key not in known]
+
 
 if __name__ == '__main__':
     import argparse
     parser = argparse.ArgumentParser(description='Appends source information to txt files.')
-    parser.add_argument("filename", help='filename')
-    parser.add_argument("source", help="bibtex key")
+    parser.add_argument("filename", nargs='?', help='filename')
+    parser.add_argument("source", nargs='?', help="bibtex key")
+    parser.add_argument(
+        "--bulk", metavar="TSV",
+        help="add the sources given in a TSV file of Pattern (glob or glottocode) and Source")
+    parser.add_argument("--processes", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("--dry-run", action='store_true', help="show the changes without making them")
     args = parser.parse_args()
 
-    out = []
-    with csvw.UnicodeDictReader(args.filename, delimiter=',') as reader:
-        for i, row in enumerate(reader, 1):
-            if row['source']:
-                print('Skipping line %d - already has content: %r' % (i, row['source']))
-            else:
-                row['source'] = args.source
-            out.append(row)
-
-    header = out[0].keys()
+    if args.bulk:
+        mapping, problems = read_mapping(args.bulk)
+    elif args.filename and args.source:
+        mapping, problems = {Path(args.filename): args.source}, []
+    else:
+        parser.error("give a filename and source, or --bulk")
 
-    shutil.copyfile(args.filename, "%s.bak" % args.filename)
+    # nothing is written unless every mapping is valid
+    problems += validate(mapping)
+    if problems:
+        for problem in problems:
+            print(problem)
+        sys.exit(1)
 
-    with csvw.UnicodeWriter(args.filename, delimiter=",") as writer:
-        writer.writerow(header)
-        for o in out:
-            writer.writerow([o[h] for h in header])
-    
\ No newline at end of file
+    tasks = [(f, source, args.dry_run) for f, source in sorted(mapping.items())]
+    with multiprocessing.Pool(min(args.processes, len(tasks)) or 1) as pool:
+        for filename, changed, messages, diff in pool.imap(_add_source, tasks):
+            if args.bulk:
+                print("%s: %d rows set to '%s', %d skipped" % (
+                    filename, changed, mapping[filename], len(messages)))
+            else:
+                for message in messages:
+                    print(message)
+            for line in diff:
+                print(line)
@@ -1,10 +1,12 @@
 #!/usr/bin/env python3
 # coding=utf-8
-import gzip
+import os
 import json
 
 from collections import Counter
 
+from dumpreader import iter_records, open_dump
+
 IGNORE = [
     'admin.logentry',
     'auth.group',
@@ -31,24 +33,27 @@ IGNORE = [
 
 if __name__ == '__main__':
     import argparse
-    parser = argparse.ArgumentParser(description='Does something.')
-    parser.add_argument("filename", help='filename')
+    parser = argparse.ArgumentParser(description='Removes unneeded models from a website dump.')
+    parser.add_argument("filename", help='filename of the dump, e.g. dump.json.gz')
     args = parser.parse_args()
 
-    removed = Counter()
-    with gzip.open('dump.json.gz', 'r') as handle:
-        out = []
-        for i, record in enumerate(json.loads(handle.read().decode('utf-8')), 1):
+    # stream the records into a temporary file, then replace the dump
+    removed, kept = Counter(), 0
+    tmp = "%s.tmp%s" % os.path.splitext(args.filename)
+    with open_dump(tmp, 'wt') as handle:
+        handle.write('[')
+        for i, record in enumerate(iter_records(args.filename), 1):
             if record['model'] in IGNORE:
                 removed[record['model']] += 1
             else:
-                out.append(record)
+                if kept:
+                    handle.write(', ')
+                handle.write(json.dumps(record))
+                kept += 1
+        handle.write(']')
     
-    print("%d / %d records kept" % (len(out), i))
+    print("%d / %d records kept" % (kept, i))
     for r in removed.most_common():
         print("\t%-40s\t%d" % r)
     
-    # write
-    with gzip.open('dump.json.gz', 'w') as handle:
-        handle.write(json.dumps(out).encode('utf-8'))
-    
\ No newline at end of file
+    os.replace(tmp, args.filename)
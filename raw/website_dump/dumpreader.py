@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# coding=utf-8
+"""Streaming reader for the (gzipped) Django JSON dump of the website"""
+import re
+import gzip
+import json
+
+WHITESPACE = re.compile(r'\s*')
+
+
+def open_dump(filename, mode='rt'):
+    if str(filename).endswith('.gz'):
+        return gzip.open(filename, mode, encoding='utf-8')
+    return open(filename, mode, encoding='utf-8')
+
+
+def iter_records(filename, models=None, chunksize=2 ** 16):
+    """
+    Yields the records of the JSON array in `filename` one at a time,
+    decoding the stream in chunks so that only one record (plus a chunk of
+    text) is held in memory. If `models` is given, only records whose
+    `model` is in `models` are returned.
+    """
+    decoder = json.JSONDecoder()
+    with open_dump(filename) as handle:
+        buffer, pos, eof = '', 0, False
+        state = 'start'
+        while True:
+            pos = WHITESPACE.match(buffer, pos).end()
+            if pos > chunksize:  # drop what we have consumed
+                buffer, pos = buffer[pos:], 0
+            if pos == len(buffer):
+                if eof:
+                    raise ValueError("Unexpected end of %s" % filename)
+                chunk = handle.read(chunksize)
+                eof = not chunk
+                buffer += chunk
+                continue
+
+            if state == 'start':
+                if buffer[pos] != '[':
+                    raise ValueError("%s is not a JSON array" % filename)
+                pos += 1
+                state = 'first'
+            elif state == 'separator':
+                if buffer[pos] == ']':
+                    return
+                if buffer[pos] != ',':
+                    raise ValueError("Expected ',' at offset %d of %s" % (pos, filename))
+                pos += 1
+                state = 'value'
+            elif state == 'first' and buffer[pos] == ']':
+                return
+            else:
+                try:
+                    record, end = decoder.raw_decode(buffer, pos)
+                    if end == len(buffer) and not eof:
+                        # a number may continue in the next chunk
+                        raise json.JSONDecodeError("Truncated value", buffer, end)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                    chunk = handle.read(chunksize)
+                    eof = not chunk
+                    buffer += chunk
+                    continue
+                pos = end
+                state = 'separator'
+                if models is None or record['model'] in models:
+                    yield record
@@ -1,17 +1,25 @@
-import gzip
-import json
 from collections import defaultdict, Counter
 from pathlib import Path
 
 import csvw
-import attr
-from pyglottolog import Glottolog
+
+from dumpreader import iter_records
 
 
 GLOTTOLOG = Path("/Users/simon/Library/Application Support/cldf/glottolog")
 
 RAW_DIR = Path(".")
 
+# the models of the website dump that are used below
+MODELS = {
+    'core.source',
+    'core.language',
+    'lexicon.word',
+    'lexicon.lexicon',
+    'pronouns.pronoun',
+    'pronouns.paradigm',
+}
+
 # remove duplicates and replace "in press's" etc with published versions
 SOURCES_TO_RENAME = {
     # OLD -> NEW
@@ -144,6 +152,52 @@ DIRMAP = {
     'other': RAW_DIR / 'Other',
 }
 
+# glottocode -> family ID cache, so re-imports don't need Glottolog.
+# Rebuild with `website_to_txt.py --refresh-families`.
+FAMILIES = RAW_DIR / 'families.tsv'
+
+
+def get_family(glottolog, glottocode):
+    try:
+        return glottolog.languoid(glottocode).family.id
+    except:
+        return 'other'  # no family = isolate
+
+
+def load_families(filename=FAMILIES):
+    if not filename.exists():
+        return {}
+    with csvw.UnicodeDictReader(filename, delimiter="\t") as reader:
+        return {row['Glottocode']: row['Family'] for row in reader}
+
+
+def write_families(families, filename=FAMILIES):
+    with csvw.UnicodeWriter(filename, delimiter="\t") as writer:
+        writer.writerow(['Glottocode', 'Family'])
+        for glottocode in sorted(families):
+            writer.writerow([glottocode, families[glottocode]])
+
+
+def load_models(filename):
+    # one pass to get records into a dict of dicts so we can merge
+    # information across objects
+    models = defaultdict(dict)
+    for record in iter_records(filename, models=MODELS):
+        models[record['model']][record['pk']] = record['fields']
+    return models
+
+
+def index_paradigms(mappings, lexicon):
+    # index paradigm -> lexemes once. Lexemes are kept in lexicon order so
+    # that the (stable) sort by pronoun key gives the same order as
+    # scanning the whole lexicon for each paradigm.
+    position = {pk: i for i, pk in enumerate(lexicon)}
+    return {
+        pdm_pk: sorted({r for r in entries if r in lexicon}, key=position.get)
+        for pdm_pk, entries in mappings.items()
+    }
+
+
 def get_name(language, dialect, variant, analect, glottocode):
     filename = language.replace('/', '-')
     if dialect:
@@ -176,19 +230,20 @@ def write_csv(filename, records):
 
 
 if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Writes the website dump to raw paradigm files.')
+    parser.add_argument(
+        "--glottolog", default=GLOTTOLOG, type=Path, help='path to a Glottolog clone')
+    parser.add_argument(
+        "--refresh-families", action='store_true',
+        help='rebuild %s from Glottolog for all glottocodes in etc/languages.tsv' % FAMILIES)
+    args = parser.parse_args()
     
     for d in DIRMAP:
         if not DIRMAP[d].exists():
             DIRMAP[d].mkdir()
     
-    G = Glottolog(GLOTTOLOG)
-    
-    # one pass to get records into a dict of dicts so we can merge
-    # information across objects
-    models = defaultdict(dict)
-    with gzip.open(RAW_DIR / 'dump.json.gz', 'r') as handle:
-        for record in json.loads(handle.read().decode('utf-8')):
-            models[record['model']][record['pk']] = record['fields']
+    models = load_models(RAW_DIR / 'dump.json.gz')
     
     # load source mapping
     sources = {}
@@ -207,6 +262,28 @@ if __name__ == '__main__':
             
             glottocodes[pk] = row['Glottocode']
 
+    if args.refresh_families:
+        # imported here, so xlsx_to_csv.py can import this module without pyglottolog
+        from pyglottolog import Glottolog
+        G = Glottolog(args.glottolog)
+        families = {g: get_family(G, g) for g in set(glottocodes.values())}
+        write_families(families)
+        print("WRITING: %d families -> %s" % (len(families), FAMILIES))
+        raise SystemExit
+
+    # only go to Glottolog for glottocodes not in the family cache
+    families = load_families()
+    missing = {
+        glottocodes[fields['language']] for pk, fields in models['pronouns.paradigm'].items()
+        if pk not in PARADIGMS_TO_IGNORE and glottocodes[fields['language']] not in families
+    }
+    if missing:
+        from pyglottolog import Glottolog
+        G = Glottolog(args.glottolog)
+        families.update({g: get_family(G, g) for g in missing})
+        write_families(families)
+        print("CACHED: %d families -> %s" % (len(missing), FAMILIES))
+
 
     # load pronoun keys for sorting purposes below:
     pronoun_keys = {}
@@ -268,6 +345,8 @@ if __name__ == '__main__':
             glottocode=glottocodes[lang_pk],
             source=sources[fields['source']],
         )
+
+    paradigm_lexemes = index_paradigms(mappings, lexicon)
     
     # load paradigms from website
     # {'editor': ['simon'], 'added': '2013-10-10T06:55:42.384Z', 'language': 3, 'source': 1, 'comment': '', 'analect': 'F', 'label': None}
@@ -288,13 +367,7 @@ if __name__ == '__main__':
             dialect = languages[fields['language']]['dialect']
             variant = None
     
-        o = G.languoid(glottocode)
-        
-        try:
-            family_id = o.family.id
-        except:
-            family_id = 'other'  # no family = isolate
-        
+        family_id = families[glottocode]
         if family_id not in DIRMAP:
             family_id = 'other'
         
@@ -315,7 +388,7 @@ if __name__ == '__main__':
             raise ValueError("ERROR %d" % pdm_pk)
         
         # collect lexemes and sort
-        records = [lexicon[r] for r in lexicon if r in mappings[pdm_pk]]
+        records = [lexicon[r] for r in paradigm_lexemes[pdm_pk]]
         records = sorted(records, key=lambda k: (pronoun_keys[k['parameter']]))
         
         print(
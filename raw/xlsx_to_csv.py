@@ -1,14 +1,23 @@
 #!/usr/bin/env python3
 # coding=utf-8
-"""..."""
+"""Converts coder spreadsheets (xlsx) to paradigm CSV files"""
 __author__ = 'Simon J. Greenhill <simon@simon.net.nz>'
 __copyright__ = 'Copyright (c) 2022 Simon J. Greenhill'
 __license__ = 'New-style BSD'
 
+import sys
+import glob
+import multiprocessing
+from pathlib import Path
+
 import csvw
 from openpyxl import load_workbook
 
-EXPECTED = [ 
+RAW_DIR = Path(__file__).parent
+ETC_DIR = RAW_DIR.parent / 'etc'
+WEBSITE_DUMP = RAW_DIR / 'website_dump'
+
+EXPECTED = [
     'word', 'ipa', 'parameter', 'description', 'alternative', 'comment',
     'translation', 'glottocode', 'notes'
 ]
@@ -16,35 +25,151 @@ EXPECTED = [
 OUTHEADER = "word,ipa,parameter,description,localid,alternative,comment,translation,glottocode,source".split(",")
 
 def read(filename):
-    wb = load_workbook(filename)
-    header = None
-    for i, row in enumerate(wb.active.iter_rows(values_only=True)):
-        if i == 0:
-            header = row
-            continue
-        
-        row = dict(zip(header, row))
-        # check expected
-        missing = [e for e in EXPECTED if e not in row]
-        if len(missing):
-            raise ValueError("Missing column %s" % e)
-        # move notes -> source
-        row['source'] = row['notes']
-        del(row['notes'])
-        
-        yield row
+    # read-only workbooks are streamed rather than loaded in full
+    wb = load_workbook(filename, read_only=True)
+    try:
+        header = None
+        for i, row in enumerate(wb.active.iter_rows(values_only=True)):
+            if i == 0:
+                header = row
+                # check expected
+                missing = [e for e in EXPECTED if e not in header]
+                if len(missing):
+                    raise ValueError("Missing column(s) %s" % ", ".join(missing))
+                continue
+
+            row = dict(zip(header, row))
+            # move notes -> source
+            row['source'] = row['notes']
+            del(row['notes'])
+
+            yield row
+    finally:
+        wb.close()
+
+
+def convert(filename):
+    """
+    Reads the workbook `filename`, returning (filename, rows, error) so that
+    failures can be collected from worker processes rather than raised.
+    """
+    try:
+        rows = [["" if row.get(h) is None else row.get(h) for h in OUTHEADER] for row in read(filename)]
+        return filename, [r for r in rows if any(r)], None
+    except Exception as e:
+        return filename, None, "%s: %s" % (e.__class__.__name__, e)
+
+
+class Router(object):
+    """
+    Finds the family directory and the filename (following `get_name` in
+    website_dump/website_to_txt.py) for a converted workbook.
+
+    A glottocode's family is taken from existing paradigm files in raw/,
+    then from the website import's cache of Glottolog families, and is
+    `Other` otherwise. Language details come from etc/languages.tsv if the
+    glottocode is listed there once, otherwise the workbook's name is used.
+    """
+    def __init__(self, raw_dir=RAW_DIR, etc_dir=ETC_DIR):
+        sys.path.insert(0, str(WEBSITE_DUMP))
+        from website_to_txt import DIRMAP, get_name, load_families
+
+        self.raw_dir = raw_dir
+        self.get_name = get_name
+        self.families = {
+            glottocode: DIRMAP.get(family, DIRMAP['other']).name
+            for glottocode, family in load_families(WEBSITE_DUMP / 'families.tsv').items()}
+        for p in raw_dir.glob('*/*.csv'):
+            self.families[p.stem.split(" ")[-1]] = p.parent.name
+
+        self.languages = {}
+        with csvw.UnicodeDictReader(etc_dir / 'languages.tsv', delimiter="\t") as reader:
+            for row in reader:
+                self.languages.setdefault(row['Glottocode'], []).append(row)
+
+    def __call__(self, workbook, rows):
+        glottocodes = {r[OUTHEADER.index('glottocode')] for r in rows} - {''}
+        if len(glottocodes) != 1:
+            raise ValueError("Expected one glottocode, found %s" % (sorted(glottocodes) or 'none'))
+        glottocode = glottocodes.pop()
+
+        listed = self.languages.get(glottocode, [])
+        if len(listed) == 1:
+            language = listed[0]
+            name = self.get_name(
+                language['Name'], language['Dialect'], language['Variant'],
+                language['Analect'], glottocode)
+        else:
+            name = self.get_name(Path(workbook).stem, None, None, None, glottocode)
+        return self.raw_dir / self.families.get(glottocode, 'Other') / name
+
+
+def write(filename, rows):
+    with csvw.UnicodeWriter(filename) as writer:
+        writer.writerow(OUTHEADER)
+        for row in rows:
+            writer.writerow(row)
+
+
+def batch(workbooks, processes=1, overwrite=False, dry_run=False):
+    """
+    Converts `workbooks` in parallel, writing them into raw/. Returns the
+    list of (workbook, problem) for the workbooks that failed.
+    """
+    router = Router()
+    failures = []
+    with multiprocessing.Pool(processes) as pool:
+        for workbook, rows, error in pool.imap_unordered(convert, workbooks):
+            try:
+                if error:
+                    raise ValueError(error)
+                if not rows:
+                    raise ValueError("No rows")
+                target = router(workbook, rows)
+                if target.exists() and not overwrite:
+                    raise ValueError("%s exists (use --overwrite)" % target)
+            except ValueError as e:
+                failures.append((workbook, str(e)))
+                continue
+            print("%s -> %s (%d rows)" % (workbook, target, len(rows)))
+            if not dry_run:
+                target.parent.mkdir(exist_ok=True)
+                write(target, rows)
+    return failures
 
 
 if __name__ == '__main__':
     import argparse
-    parser = argparse.ArgumentParser(description='Does something.')
+    parser = argparse.ArgumentParser(description='Converts xlsx files to CSV.')
     parser.add_argument("xlsx", help='xlsx filename (INPUT)')
-    parser.add_argument("csv", help='csv filename (OUTPUT)')
+    parser.add_argument("csv", nargs='?', help='csv filename (OUTPUT)')
+    parser.add_argument(
+        "--batch", action='store_true',
+        help='convert a directory or glob of xlsx files into the family directories in raw/')
+    parser.add_argument("--processes", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("--overwrite", action='store_true', help='replace existing CSV files')
+    parser.add_argument("--dry-run", action='store_true', help="show what would be written")
     args = parser.parse_args()
 
-    with csvw.UnicodeWriter(args.csv) as writer:
-        writer.writerow(OUTHEADER)
-        for row in read(args.xlsx):
-            #print(row)
-            writer.writerow([row.get(h, "") for h in OUTHEADER])
+    if not args.batch:
+        if not args.csv:
+            parser.error("csv filename required")
+        with csvw.UnicodeWriter(args.csv) as writer:
+            writer.writerow(OUTHEADER)
+            for row in read(args.xlsx):
+                #print(row)
+                writer.writerow([row.get(h, "") for h in OUTHEADER])
+        sys.exit()
+
+    if Path(args.xlsx).is_dir():
+        workbooks = sorted(str(p) for p in Path(args.xlsx).glob('*.xlsx'))
+    else:
+        workbooks = sorted(glob.glob(args.xlsx))
+    failures = batch(workbooks, args.processes, overwrite=args.overwrite, dry_run=args.dry_run)
 
+    print("\n%d of %d workbooks converted" % (len(workbooks) - len(failures), len(workbooks)))
+    if failures:
+        print("\nFailures:")
+        for workbook, problem in sorted(failures):
+            print(" %s: %s" % (workbook, problem))
+        sys.exit(1)
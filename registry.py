@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# coding=utf-8
+"""Index of the paradigms listed in etc/languages.tsv"""
+import functools
+from pathlib import Path
+
+import csvw
+
+
+def split_filename(filename):
+    """Returns the (name, glottocode) of a paradigm filename like `Nen nenn1238.csv`."""
+    name, _, glottocode = Path(filename).stem.rpartition(' ')
+    return name, glottocode
+
+
+class LanguageRegistry(object):
+    """
+    The rows of etc/languages.tsv, read once and indexed for the build and
+    the checker:
+
+    - `ids`: Filename -> ID
+    - `paradigms`: ID -> LocalID
+    - `glottocodes`: Glottocode -> [ID, ...]
+    - `families`: family directory of `raw_dir` -> [ID, ...] of the listed
+      files found there
+
+    A filename or ID listed more than once maps to its last row, as in
+    `LexibankWriter.add_languages`.
+    """
+    def __init__(self, rows, raw_dir=None):
+        self.rows = list(rows)
+        self.raw_dir = Path(raw_dir) if raw_dir else None
+        self.ids, self.paradigms, self.glottocodes = {}, {}, {}
+        for row in self.rows:
+            self.ids[row['Filename']] = row['ID']
+            self.paradigms[row['ID']] = row['LocalID']
+            ids = self.glottocodes.setdefault(row['Glottocode'], [])
+            if row['ID'] not in ids:
+                ids.append(row['ID'])
+        self.filenames = set(self.ids)
+
+    @classmethod
+    def from_tsv(cls, filename, raw_dir=None):
+        with csvw.UnicodeDictReader(filename, delimiter="\t") as reader:
+            return cls(reader, raw_dir)
+
+    def __contains__(self, filename):
+        return filename in self.ids
+
+    def __len__(self):
+        return len(self.rows)
+
+    @functools.cached_property
+    def families(self):
+        families = {}
+        for p in sorted(self.raw_dir.glob('*/*.csv')):
+            if p.name in self.ids:
+                families.setdefault(p.parent.name, []).append(self.ids[p.name])
+        return families
+
+    def check(self):
+        """Yields the rows whose Glottocode differs from the glottocode in their Filename."""
+        for i, row in enumerate(self.rows, 2):
+            glottocode = split_filename(row['Filename'])[1]
+            if row['Filename'] and glottocode != row['Glottocode']:
+                yield "L%d - glottocode '%s' does not match filename '%s'" % (
+                    i, row['Glottocode'], row['Filename'])
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# coding=utf-8
+"""Serves read-only JSON queries of the CLDF dataset over HTTP"""
+import json
+import hashlib
+import logging
+import threading
+import dataclasses
+from decimal import Decimal
+from collections import OrderedDict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qsl, unquote
+from pathlib import Path
+
+from lexibank_pronouns import PronounLanguage, PronounConcept, file_hash
+
+REPO = Path(__file__).parent
+
+
+class NotFound(Exception):
+    pass
+
+
+class PronounIndex(object):
+    """
+    The languages, parameters and forms of the CLDF dataset in `cldf_dir`,
+    loaded once and indexed by language, parameter and glottocode.
+
+    `version` is a hash of the dataset's files, so it changes whenever the
+    dataset is rebuilt.
+    """
+    def __init__(self, cldf_dir=REPO / 'cldf'):
+        from pycldf import Dataset
+
+        metadata = Path(cldf_dir) / 'cldf-metadata.json'
+        dataset = Dataset.from_metadata(metadata)
+        self.version = hashlib.sha1(''.join(
+            file_hash(f) for f in
+            [metadata] + [Path(cldf_dir) / t.url.string for t in dataset.tables]
+        ).encode('utf8')).hexdigest()
+
+        self.languages = OrderedDict(
+            (row['ID'], PronounLanguage(**{
+                k: float(v) if isinstance(v, Decimal) else v for k, v in row.items()}))
+            for row in dataset['LanguageTable'].iterdicts())
+        self.parameters = OrderedDict(
+            (row['ID'], PronounConcept(**row)) for row in dataset['ParameterTable'].iterdicts())
+
+        self.forms = 0
+        self.by_language, self.by_parameter, self.by_glottocode = {}, {}, {}
+        for form in dataset['FormTable'].iterdicts():
+            self.by_language.setdefault(form['Language_ID'], []).append(form)
+            self.by_parameter.setdefault(form['Parameter_ID'], []).append(form)
+            self.forms += 1
+        for language in self.languages.values():
+            self.by_glottocode.setdefault(language.Glottocode, []).append(language)
+
+    def language(self, language_id):
+        if language_id not in self.languages:
+            raise NotFound("Unknown language '%s'" % language_id)
+        return self.languages[language_id]
+
+    def parameter(self, parameter_id):
+        if parameter_id not in self.parameters:
+            raise NotFound("Unknown parameter '%s'" % parameter_id)
+        return self.parameters[parameter_id]
+
+    def paradigm(self, language_id):
+        """Returns the language and its forms by parameter, in the order of the parameters."""
+        language = self.language(language_id)
+        cells = {}
+        for form in self.by_language.get(language_id, []):
+            cells.setdefault(form['Parameter_ID'], []).append(form)
+        return {
+            'language': dataclasses.asdict(language),
+            'paradigm': {p: cells[p] for p in self.parameters if p in cells},
+        }
+
+    def parameter_forms(self, parameter_id, attributes=None):
+        """Returns the parameter and its forms in the languages matching the dict `attributes`."""
+        attributes = attributes or {}
+        parameter = self.parameter(parameter_id)
+        fields = {f.name for f in dataclasses.fields(PronounLanguage)}
+        unknown = set(attributes) - fields
+        if unknown:
+            raise ValueError("Unknown language attribute(s) %s" % ", ".join(sorted(unknown)))
+        return {
+            'parameter': dataclasses.asdict(parameter),
+            'forms': [
+                f for f in self.by_parameter.get(parameter_id, [])
+                if all(str(getattr(self.languages[f['Language_ID']], k)) == v
+                       for k, v in attributes.items())],
+        }
+
+    def glottocode(self, glottocode):
+        """Returns the languages (i.e. paradigms) with `glottocode`."""
+        if glottocode not in self.by_glottocode:
+            raise NotFound("Unknown glottocode '%s'" % glottocode)
+        return {
+            'glottocode': glottocode,
+            'languages': [dataclasses.asdict(l) for l in self.by_glottocode[glottocode]],
+        }
+
+    def query(self, path, params=None):
+        """
+        Answers the query `path`, with the query parameters `params` (a dict):
+
+        - `/`: the dataset version and number of languages, parameters and forms
+        - `/languages/<ID>`: the paradigm of a language
+        - `/parameters/<ID>`: the forms of a parameter, in the languages
+          matching the query parameters (e.g. `?Family=Pama-Nyungan`)
+        - `/glottocodes/<glottocode>`: the languages with a glottocode
+        """
+        parts = [unquote(p) for p in path.strip('/').split('/') if p]
+        if not parts:
+            return {
+                'version': self.version,
+                'languages': len(self.languages),
+                'parameters': len(self.parameters),
+                'forms': self.forms,
+            }
+        if len(parts) == 2:
+            if parts[0] == 'languages':
+                return self.paradigm(parts[1])
+            if parts[0] == 'parameters':
+                return self.parameter_forms(parts[1], params)
+            if parts[0] == 'glottocodes':
+                return self.glottocode(parts[1])
+        raise NotFound("Unknown query '%s'" % path)
+
+
+class ResponseCache(object):
+    """Size-bounded, thread-safe cache of response bodies in least-recently-used order."""
+    def __init__(self, size=1024):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, body):
+        with self.lock:
+            self.entries[key] = body
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+
+class Handler(BaseHTTPRequestHandler):
+    """
+    Answers GET requests with `server.index.query`. Successful responses are
+    cached by URL and carry the dataset version as ETag, so clients can
+    revalidate with If-None-Match.
+    """
+    protocol_version = 'HTTP/1.1'  # keep connections alive
+    disable_nagle_algorithm = True  # headers and body are sent separately
+
+    def do_GET(self):
+        index, cache = self.server.index, self.server.cache
+        etag = '"%s"' % index.version
+        if etag in [t.strip() for t in self.headers.get('If-None-Match', '').split(',')]:
+            self.respond(304, b'', etag)
+            return
+
+        body = cache.get(self.path)
+        if body is None:
+            url = urlsplit(self.path)
+            try:
+                body = json.dumps(
+                    index.query(url.path, dict(parse_qsl(url.query))), ensure_ascii=False
+                ).encode('utf8')
+            except NotFound as e:
+                self.respond(404, json.dumps({'error': str(e)}).encode('utf8'))
+                return
+            except ValueError as e:
+                self.respond(400, json.dumps({'error': str(e)}).encode('utf8'))
+                return
+            except Exception as e:  # never drop the connection without a response
+                logging.exception("Error answering %s" % self.path)
+                self.respond(500, json.dumps({'error': "%s: %s" % (e.__class__.__name__, e)}).encode('utf8'))
+                return
+            cache.put(self.path, body)
+        self.respond(200, body, etag)
+
+    def respond(self, status, body, etag=None):
+        self.send_response(status)
+        if etag:
+            self.send_header('ETag', etag)
+        if status != 304:
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.debug("%s - %s" % (self.address_string(), format % args))
+
+
+def make_server(index, host='127.0.0.1', port=8000, cache_size=1024):
+    """Returns a server answering queries of `index` with a thread per request."""
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    server.index = index
+    server.cache = ResponseCache(cache_size)
+    return server
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Serves JSON queries of the CLDF dataset.')
+    parser.add_argument("--cldf", type=Path, default=REPO / 'cldf', help='the CLDF directory')
+    parser.add_argument("--host", default='127.0.0.1')
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--cache-size", type=int, default=1024, help='the number of responses cached')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    index = PronounIndex(args.cldf)
+    server = make_server(index, args.host, args.port, args.cache_size)
+    logging.info("%d languages, %d parameters and %d forms of version %s served at http://%s:%d/" % (
+        len(index.languages), len(index.parameters), index.forms, index.version[:12],
+        args.host, server.server_address[1]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -11,7 +11,7 @@ setup(
     description=metadata['title'],
     license=metadata.get('license', ''),
     url=metadata.get('url', ''),
-    py_modules=['lexibank_pronouns'],
+    py_modules=['lexibank_pronouns', 'bibindex', 'registry', 'cachefile'],
     include_package_data=True,
     zip_safe=False,
     entry_points={
@@ -22,6 +22,7 @@ setup(
     install_requires=[
         'pylexibank>=3.4.0',
         'openpyxl',
+        'numpy',
     ],
     extras_require={
         'test': [
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# coding=utf-8
+"""Generates synthetic paradigm files for scale testing the build and the checker"""
+import random
+import shutil
+from pathlib import Path
+
+import csvw
+
+REPO = Path(__file__).parent
+
+LANGUAGE_COLUMNS = [
+    'ID', 'LocalID', 'Name', 'Dialect', 'Variant', 'Filename', 'Glottocode', 'Analect', 'Coder',
+    'Comment']
+
+CONSONANTS = 'ptkbdgmnŋszhlrwjʔ'
+VOWELS = 'aeiouəɨ'
+
+# the kinds of error `SyntheticCorpus` can inject into a row, all of which
+# checker.py reports
+ERRORS = ('parameter', 'normalisation', 'glottocode', 'empty-source', 'unknown-source')
+
+
+def get_families(raw_dir=REPO / 'raw'):
+    """Returns the family directories in `raw_dir` with their number of paradigms."""
+    return {
+        d.name: len(list(d.glob('*.csv')))
+        for d in sorted(raw_dir.iterdir()) if d.is_dir() and d.name != 'website_dump'
+    }
+
+
+class SyntheticCorpus(object):
+    """
+    Writes `size` synthetic paradigms, drawn deterministically from `seed`.
+
+    Every paradigm fills the cells of raw/template.csv. With probability
+    `syncretism` a cell reuses the form of an earlier cell of the same person
+    (e.g. 1sg_a = 1sg_s), and with probability `errors` a row with a word gets
+    one of the `ERRORS` injected. Files are written one at a time, so memory
+    use does not grow with `size`.
+    """
+    def __init__(self, size, syncretism=0.3, errors=0.0, empty=0.2, seed=1):
+        self.size = size
+        self.syncretism = syncretism
+        self.errors = errors
+        self.empty = empty
+        self.seed = seed
+        self.families = get_families()
+        with csvw.UnicodeDictReader(REPO / 'raw' / 'template.csv') as reader:
+            self.template = list(reader)
+        with csvw.UnicodeDictReader(REPO / 'etc' / 'concepts.tsv', delimiter="\t") as reader:
+            self.concepts = {row['ID']: row for row in reader}
+        from checker import CODERS
+        self.coders = CODERS
+        self.injected = {e: 0 for e in ERRORS}
+        self.forms = 0
+
+    def word(self, rng, consonants, vowels):
+        return ''.join(
+            rng.choice(consonants) + rng.choice(vowels) for _ in range(rng.randint(1, 3)))
+
+    def language(self, rng, i):
+        name = self.word(rng, 'ptkbdgmnslrw', 'aeiou').capitalize()
+        stem = (name.lower() + 'xxxx')[:4]
+        glottocode = '%s%04d' % (stem, i % 10000)
+        family = rng.choices(list(self.families), weights=list(self.families.values()))[0]
+        return dict(
+            ID='%s-%d' % (name.lower(), i),
+            LocalID=str(i + 1),
+            Name=name,
+            Dialect='',
+            Variant='',
+            Filename='%s %d %s.csv' % (name, i, glottocode),
+            Glottocode=glottocode,
+            Analect='Free' if rng.random() < 0.8 else 'Bound',
+            Coder=rng.choice(self.coders),
+            Comment='',
+            Family=family,
+        )
+
+    def source(self, language):
+        return 'synthetic-%s' % language['ID']
+
+    def paradigm(self, rng, language):
+        """Yields the rows of a paradigm file for `language`."""
+        consonants = rng.sample(CONSONANTS, rng.randint(6, len(CONSONANTS)))
+        vowels = rng.sample(VOWELS, rng.randint(3, len(VOWELS)))
+        filled = {}  # person -> forms used so far
+        for row in self.template:
+            concept = self.concepts[row['parameter']]
+            row = dict(row, glottocode=language['Glottocode'], source=self.source(language))
+            if rng.random() < self.empty:
+                row.update(word='', source='')
+            else:
+                previous = filled.setdefault(concept['Person'], [])
+                if previous and rng.random() < self.syncretism:
+                    row['word'] = rng.choice(previous)
+                else:
+                    row['word'] = self.word(rng, consonants, vowels)
+                    previous.append(row['word'])
+                self.forms += 1
+                if rng.random() < self.errors:
+                    self.inject(rng, row)
+            yield row
+
+    def inject(self, rng, row):
+        error = rng.choice(ERRORS)
+        self.injected[error] += 1
+        if error == 'parameter':
+            row['parameter'] = row['parameter'] + 'x'
+        elif error == 'normalisation':
+            row['word'] = row['word'] + 'e\u0301'  # not NFC
+        elif error == 'glottocode':
+            row['glottocode'] = row['glottocode'][:-1]
+        elif error == 'empty-source':
+            row['source'] = ''
+        else:
+            row['source'] = row['source'] + 'x'
+
+    def write(self, target):
+        """
+        Writes the corpus as a dataset directory `target`, i.e. the paradigm
+        files in raw/<Family>/, etc/languages.tsv, raw/sources.bib, and a copy
+        of etc/concepts.tsv and metadata.json.
+        """
+        target = Path(target)
+        target.joinpath('etc').mkdir(parents=True, exist_ok=True)
+        target.joinpath('raw').mkdir(exist_ok=True)
+        shutil.copy(REPO / 'metadata.json', target / 'metadata.json')
+        shutil.copy(REPO / 'etc' / 'concepts.tsv', target / 'etc' / 'concepts.tsv')
+
+        rng = random.Random(self.seed)
+        columns = list(self.template[0].keys())
+        with csvw.UnicodeWriter(target / 'etc' / 'languages.tsv', delimiter="\t") as languages, \
+                open(target / 'raw' / 'sources.bib', 'w', encoding='utf8') as bib:
+            languages.writerow(LANGUAGE_COLUMNS)
+            for i in range(self.size):
+                language = self.language(rng, i)
+                languages.writerow([language[c] for c in LANGUAGE_COLUMNS])
+                bib.write(
+                    "@misc{%s,\n  title        = {Synthetic pronouns of %s},\n"
+                    "  author       = {Nobody},\n  year         = 2000\n}\n\n" % (
+                        self.source(language), language['Name']))
+
+                directory = target / 'raw' / language['Family']
+                directory.mkdir(exist_ok=True)
+                with csvw.UnicodeWriter(directory / language['Filename']) as writer:
+                    writer.writerow(columns)
+                    for row in self.paradigm(rng, language):
+                        writer.writerow([row[c] for c in columns])
+        return target
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Generates a synthetic pronoun dataset.')
+    parser.add_argument("target", type=Path, help='the directory to write the dataset to')
+    parser.add_argument("--size", type=int, default=1000, help='the number of paradigms')
+    parser.add_argument(
+        "--syncretism", type=float, default=0.3,
+        help='the probability that a cell reuses a form of the same person')
+    parser.add_argument(
+        "--errors", type=float, default=0.0,
+        help='the probability that a row with a word has an error injected')
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    corpus = SyntheticCorpus(args.size, args.syncretism, args.errors, seed=args.seed)
+    corpus.write(args.target)
+    print(f"{args.size} paradigms with {corpus.forms} forms written to {args.target}")
+    for error, count in corpus.injected.items():
+        if count:
+            print(f" {count} injected {error} errors")
@@ -1,3 +1,522 @@
+from lexibank_pronouns import (
+    write_columns, ColumnarForms, ParadigmMatrix, ParadigmSimilarity, edit_distances,
+    SQLiteExport, select_forms, FormCache,
+)
+
 
 def test_valid(cldf_dataset, cldf_logger):
     assert cldf_dataset.validate(log=cldf_logger)
+
+
+def test_columns(tmp_path):
+    forms = [
+        dict(ID='a-1sg_a-1', Language_ID='a', Parameter_ID='1sg_a', Paradigm_ID='1',
+             Value='ni, na', Form='ni', Segments=[], Source=['x-2000']),
+        dict(ID='b-1sg_a-1', Language_ID='b', Parameter_ID='1sg_a', Paradigm_ID=None,
+             Value='∅', Form='∅', Segments=['∅'], Source=['x-2000', 'y-2001']),
+    ]
+    write_columns(tmp_path / 'forms.bin', forms)
+    columns = ColumnarForms(tmp_path / 'forms.bin')
+    assert len(columns) == 2
+    assert list(columns.codes('Parameter_ID')) == [0, 0]
+    assert list(columns.labels('Language_ID')) == ['a', 'b']
+    assert columns['Paradigm_ID'] == ['1', None]
+    assert list(columns['Form']) == ['ni', '∅']
+    assert list(columns['Source']) == ['x-2000', 'x-2000;y-2001']
+
+
+def test_form_cache(tmp_path):
+    cache = FormCache(tmp_path / 'forms.json', namespace='x', profiles=['a'])
+    cache.put('ni', [dict(Form='ni', Segments=['n', 'i'], Profile='default')], 'b')
+    cache.put('ni', [dict(Form='ni', Segments=['ɲ', 'i'], Profile='a')], 'a')
+    assert cache.get('ni', 'c')[0]['Segments'] == ['n', 'i']
+    assert cache.get('ni', 'a')[0]['Profile'] == 'a'
+    cache.write()
+    assert len(FormCache(tmp_path / 'forms.json', namespace='x', profiles=['a']).entries) == 2
+    assert not FormCache(tmp_path / 'forms.json', namespace='y').entries
+    assert [p.name for p in tmp_path.iterdir()] == ['forms.json']
+
+    # a truncated cache is treated as empty, and replaced as a whole
+    text = tmp_path.joinpath('forms.json').read_text(encoding='utf8')
+    tmp_path.joinpath('forms.json').write_text(text[:len(text) // 2], encoding='utf8')
+    cache = FormCache(tmp_path / 'forms.json', namespace='x')
+    assert not cache.entries
+    cache.write()
+    assert FormCache(tmp_path / 'forms.json', namespace='x').entries == {}
+
+
+def test_flag(monkeypatch):
+    from lexibank_pronouns import flag
+
+    monkeypatch.delenv('PRONOUNS_INCREMENTAL', raising=False)
+    assert not flag('incremental')
+    for value, on in [('', False), ('0', False), ('false', False), ('No', False), ('1', True), ('yes', True)]:
+        monkeypatch.setenv('PRONOUNS_INCREMENTAL', value)
+        assert flag('incremental') == on
+
+
+def build(directory, monkeypatch, clean=False, **options):
+    """
+    Builds the dataset in `directory` with the given PRONOUNS_<NAME> options
+    (from scratch if `clean`), returning the bytes of cldf/forms.csv.
+    """
+    import os
+    import shutil
+    import logging
+    import argparse
+    from lexibank_pronouns import Dataset
+
+    for name in [k for k in os.environ if k.startswith('PRONOUNS_')]:
+        monkeypatch.delenv(name)
+    for name, value in options.items():
+        monkeypatch.setenv('PRONOUNS_%s' % name.upper(), str(value))
+    if clean:
+        shutil.rmtree(directory / '.cache', ignore_errors=True)
+
+    dataset = type('TestDataset', (Dataset,), {'dir': directory})()
+    args = argparse.Namespace(log=logging.getLogger('test'), dev=True)
+    with dataset.cldf_writer(args) as writer:
+        args.writer = writer
+        dataset.cmd_makecldf(args)
+    return directory.joinpath('cldf', 'forms.csv').read_bytes()
+
+
+def edit_corpus(directory):
+    """Changes a word of one paradigm file and the LocalID of another language."""
+    def read(filename):
+        with open(filename, encoding='utf8', newline='') as f:  # keep the line endings
+            return f.read().split('\n')
+
+    def write(filename, lines):
+        with open(filename, 'w', encoding='utf8', newline='') as f:
+            f.write('\n'.join(lines))
+
+    paradigm = sorted(directory.glob('raw/*/*.csv'))[0]
+    lines = read(paradigm)
+    lines[1] = 'x' + lines[1]
+    write(paradigm, lines)
+
+    languages = directory / 'etc' / 'languages.tsv'
+    rows = [row.split('\t') for row in read(languages)]
+    row = next(row for row in rows[1:] if paradigm.name not in row)
+    row[rows[0].index('LocalID')] += '0'
+    write(languages, ['\t'.join(row) for row in rows])
+
+
+def test_incremental_build(tmp_path, monkeypatch):
+    import json
+    from synthetic import SyntheticCorpus
+
+    corpus = SyntheticCorpus(20).write(tmp_path / 'corpus')
+    reference = build(corpus, monkeypatch, clean=True, form_cache_size=0)
+    assert build(corpus, monkeypatch, incremental=1) == reference
+    assert build(corpus, monkeypatch, incremental=1) == reference
+
+    # a truncated manifest is ignored
+    manifest = corpus / '.cache' / 'makecldf.json'
+    manifest.write_text(manifest.read_text(encoding='utf8')[:100], encoding='utf8')
+    assert build(corpus, monkeypatch, incremental=1) == reference
+    assert json.loads(manifest.read_text(encoding='utf8'))['files']
+
+    # edited files and languages are picked up
+    edit_corpus(corpus)
+    edited = build(corpus, monkeypatch, incremental=1)
+    assert edited != reference
+    assert build(corpus, monkeypatch, clean=True, form_cache_size=0) == edited
+
+
+def test_incremental_build_warnings(tmp_path, monkeypatch, caplog):
+    import shutil
+    from synthetic import SyntheticCorpus
+
+    corpus = SyntheticCorpus(20, errors=0.2).write(tmp_path / 'corpus')
+    paradigm = sorted(corpus.glob('raw/*/*.csv'))[0]
+    shutil.copy(paradigm, paradigm.parent / 'Unlisted xxxx0000.csv')
+
+    def warnings(**options):
+        caplog.clear()
+        build(corpus, monkeypatch, **options)
+        return sorted(r.getMessage() for r in caplog.records if r.getMessage().startswith('WARNING'))
+
+    expected = warnings(clean=True)
+    assert any('Unknown parameter' in w for w in expected)
+    assert any('Unknown language filename' in w for w in expected)
+    assert warnings(incremental=1) == expected
+    assert warnings(incremental=1) == expected
+
+
+def test_parallel_build(tmp_path, monkeypatch):
+    from synthetic import SyntheticCorpus
+
+    corpus = SyntheticCorpus(20).write(tmp_path / 'corpus')
+    reference = build(corpus, monkeypatch, clean=True, form_cache_size=0)
+    assert build(corpus, monkeypatch, clean=True, processes=2) == reference
+    assert build(corpus, monkeypatch, clean=True, processes=3, form_cache_size=0) == reference
+
+    edit_corpus(corpus)
+    assert build(corpus, monkeypatch, processes=2, incremental=1) == \
+        build(corpus, monkeypatch, clean=True, form_cache_size=0)
+
+
+def test_checked_build(tmp_path, monkeypatch, caplog):
+    from synthetic import SyntheticCorpus
+
+    corpus = SyntheticCorpus(20, errors=0.2).write(tmp_path / 'corpus')
+
+    def errors(**options):
+        caplog.clear()
+        forms = build(corpus, monkeypatch, clean=True, **options)
+        return forms, [r.getMessage() for r in caplog.records if r.getMessage().startswith('CHECK')]
+
+    reference = build(corpus, monkeypatch, clean=True, form_cache_size=0)
+    forms, expected = errors(check=1)
+    assert forms == reference and expected
+    assert errors(check=1, processes=2) == (reference, expected)
+
+
+def test_form_cache_build(tmp_path, monkeypatch):
+    from synthetic import SyntheticCorpus
+
+    corpus = SyntheticCorpus(20).write(tmp_path / 'corpus')
+    reference = build(corpus, monkeypatch, clean=True, form_cache_size=0)
+    assert build(corpus, monkeypatch, clean=True) == reference
+    assert corpus.joinpath('.cache', 'forms.json').exists()
+    assert build(corpus, monkeypatch) == reference
+
+    # cached forms are not reused once the lexemes they were split with change
+    value = next(
+        line.split(',')[0] for p in sorted(corpus.glob('raw/*/*.csv'))
+        for line in p.read_text(encoding='utf8').split('\n')[1:] if line.split(',')[0])
+    corpus.joinpath('etc', 'lexemes.tsv').write_text(
+        'LEXEME\tREPLACEMENT\n%s\t%s-%s\n' % (value, value, value), encoding='utf8')
+    edited = build(corpus, monkeypatch)
+    assert edited != reference
+    assert build(corpus, monkeypatch, clean=True, form_cache_size=0) == edited
+
+
+def test_stream_build(tmp_path, monkeypatch):
+    from synthetic import SyntheticCorpus
+
+    corpus = SyntheticCorpus(20).write(tmp_path / 'corpus')
+    reference = build(corpus, monkeypatch, clean=True, form_cache_size=0)
+    assert build(corpus, monkeypatch, clean=True, stream=1) == reference
+    assert build(corpus, monkeypatch, stream=1, incremental=1) == reference
+    assert build(corpus, monkeypatch, stream=1, incremental=1) == reference
+
+    edit_corpus(corpus)
+    assert build(corpus, monkeypatch, stream=1, incremental=1) == \
+        build(corpus, monkeypatch, clean=True, form_cache_size=0)
+
+
+def test_cited_sources():
+    from bibindex import cited_sources
+
+    # sources are kept as given until written, so one item may cite several keys
+    forms = [dict(Source=['a-2000;b-2001']), dict(Source=['c-2002', 'a-2000']), dict(Source=[])]
+    assert cited_sources(forms) == {'a-2000', 'b-2001', 'c-2002'}
+
+
+def test_language_registry(tmp_path):
+    from registry import LanguageRegistry
+
+    tmp_path.joinpath('Yam').mkdir()
+    tmp_path.joinpath('Yam', 'Nen nenn1238.csv').write_text('', encoding='utf8')
+    registry = LanguageRegistry([
+        dict(ID='nen', LocalID='3', Filename='Nen nenn1238.csv', Glottocode='nenn1238'),
+        dict(ID='nen-b', LocalID='4', Filename='Nen B nenn1238.csv', Glottocode='nenn1238'),
+        dict(ID='hup', LocalID='5', Filename='Hup hupy1235.csv', Glottocode='hupd1244'),
+    ], tmp_path)
+    assert registry.ids['Nen nenn1238.csv'] == 'nen' and 'Hup hupy1235.csv' in registry
+    assert registry.paradigms['nen-b'] == '4'
+    assert registry.glottocodes['nenn1238'] == ['nen', 'nen-b']
+    assert registry.families == {'Yam': ['nen']}
+    assert list(registry.check()) == [
+        "L4 - glottocode 'hupd1244' does not match filename 'Hup hupy1235.csv'"]
+
+
+def test_sqlite_export(tmp_path, cldf_dataset):
+    import sqlite3
+
+    languages = [
+        dict(ID='a', Glottocode='aaaa1234', Family='X', Analect='Bound', Filename='a.csv'),
+        dict(ID='b', Glottocode='bbbb1234', Family='X', Analect='Free')]
+    parameters = [dict(ID='12pl_a', Person='12', GrammaticalNumber='pl', Alignment='A')]
+    forms = {
+        'X/a.csv': [dict(ID='a-12pl_a-1', Language_ID='a', Parameter_ID='12pl_a', Form='ni', Source=['x', 'y'])],
+        'X/b.csv': [dict(ID='b-12pl_a-1', Language_ID='b', Parameter_ID='12pl_a', Form='na', Source=[])],
+    }
+
+    def build(forms):
+        export = SQLiteExport(tmp_path / 'pronouns.sqlite', cldf_dataset)
+        for key, rows in forms.items():
+            export.update(key, rows)
+        return export.finish(languages, parameters, {'a.csv': 'X'})
+
+    assert build(forms) == (2, 0)
+    assert build(forms) == (0, 0)
+    forms['X/a.csv'][0]['Form'] = 'nu'
+    del forms['X/b.csv']
+    assert build(forms) == (1, 1)
+
+    db = sqlite3.connect(str(tmp_path / 'pronouns.sqlite'))
+    assert [(f['ID'], f['Form'], f['Source']) for f in select_forms(db, Person='12', Analect='Bound')] == \
+        [('a-12pl_a-1', 'nu', 'x;y')]
+    assert select_forms(db, Analect='Free') == []
+    assert [f['ID'] for f in select_forms(db, directory='X')] == ['a-12pl_a-1']
+
+
+def test_sqlite_build(tmp_path, monkeypatch):
+    import csv
+    import sqlite3
+    from synthetic import SyntheticCorpus
+
+    # languages have no Family without Glottolog, but the directory of their paradigm file
+    corpus = SyntheticCorpus(20).write(tmp_path / 'corpus')
+    forms = list(csv.DictReader(build(corpus, monkeypatch, clean=True, sqlite=1).decode('utf8').splitlines()))
+    with open(corpus / 'etc' / 'languages.tsv', encoding='utf8') as f:
+        languages = list(csv.DictReader(f, delimiter='\t'))
+    directories = {p.name: p.parent.name for p in corpus.glob('raw/*/*.csv')}
+    bound = {
+        d: {l['ID'] for l in languages if directories[l['Filename']] == d and l['Analect'] == 'Bound'}
+        for d in set(directories.values())}
+    directory = max(sorted(bound), key=lambda d: len(bound[d]))
+
+    expected = [f['ID'] for f in forms if f['Language_ID'] in bound[directory]]
+    assert expected
+
+    db = sqlite3.connect(str(corpus / 'pronouns.sqlite'))
+    assert [f['ID'] for f in select_forms(db, directory=directory, Analect='Bound')] == expected
+
+
+def test_paradigm_matrix():
+    parameters = [
+        dict(ID='1sg_a', Person='1', GrammaticalNumber='sg', Alignment='A'),
+        dict(ID='1sg_s', Person='1', GrammaticalNumber='sg', Alignment='S'),
+        dict(ID='1pl_a', Person='1', GrammaticalNumber='pl', Alignment='A'),
+    ]
+    m = ParadigmMatrix(['a', 'b', 'c'], parameters, [
+        ('a', '1sg_a', 'ni'), ('a', '1sg_s', 'ni'), ('a', '1pl_a', 'ni'),
+        ('b', '1sg_a', 'ni'), ('b', '1sg_a', 'na'), ('b', '1sg_s', 'ni'),
+        ('c', '1sg_a', '∅'), ('c', '1sg_s', '∅'),
+    ])
+    assert m.cell('b', '1sg_a') == ('na', 'ni')
+    assert m.where(m.missing[:, m.columns['1pl_a']]) == ['b', 'c']
+    assert m.where(m.syncretic('1sg_a', '1sg_s')) == ['a', 'c']
+    assert m.where(m.syncretic('1sg_a', '1sg_s', include_zero=False)) == ['a']
+    assert m.where(m.equal(dict(GrammaticalNumber='pl'), dict(GrammaticalNumber='sg'))) == ['a']
+    assert m.syncretism()[0].tolist() == [3, 2, 1]
+
+
+def test_similarity():
+    assert edit_distances(['kitten', 'ni', ''], ['sitting', 'ni', 'ab']).round(3).tolist() == \
+        [0.429, 0.0, 1.0]
+    parameters = [dict(ID='1sg'), dict(ID='2sg'), dict(ID='3sg')]
+    m = ParadigmMatrix(['a', 'b', 'c'], parameters, [
+        ('a', '1sg', 'ni'), ('a', '2sg', 'ni'), ('a', '3sg', 'ja'),
+        ('b', '1sg', 'ni'), ('b', '2sg', 'ni'), ('b', '3sg', 'jo'),
+        ('c', '1sg', 'ku'), ('c', '2sg', 'mu'),
+    ])
+    similarity = ParadigmSimilarity(m, block=2)
+    assert similarity.syncretism_distances().tolist() == [[0, 0, 1], [0, 0, 1], [1, 1, 0]]
+    assert similarity.form_distances()[0].round(3).tolist() == [0, 0.167, 1]
+    assert similarity.neighbours(k=1)['a'][0][0] == 'b'
+
+
+def test_synthetic_corpus(tmp_path):
+    import checker
+    from synthetic import SyntheticCorpus
+
+    corpus = SyntheticCorpus(20, errors=0.05, seed=3)
+    corpus.write(tmp_path / 'a')
+    SyntheticCorpus(20, errors=0.05, seed=3).write(tmp_path / 'b')
+    files = sorted(p.relative_to(tmp_path / 'a') for p in (tmp_path / 'a').rglob('*.*'))
+    assert len(files) == 20 + 4
+    for p in files:
+        assert (tmp_path / 'a' / p).read_bytes() == (tmp_path / 'b' / p).read_bytes()
+
+    # every injected error is found by the checker
+    context = checker.Context(tmp_path / 'a' / 'etc', tmp_path / 'a' / 'raw')
+    errors = 0
+    for p in (tmp_path / 'a' / 'raw').glob('*/*.csv'):
+        errors += len(checker.check_file(p, context)['errors'])
+    assert errors == sum(corpus.injected.values()) > 0
+
+
+def test_result_cache(tmp_path):
+    from checker import ResultCache
+
+    dependency = tmp_path / 'languages.tsv'
+    dependency.write_text('ID\n', encoding='utf8')
+    cache = ResultCache(tmp_path / 'checker.json', [dependency])
+    cache.update('a.csv', 'x', [['error'], 3])
+    cache.write()
+    assert ResultCache(tmp_path / 'checker.json', [dependency]).get('a.csv', 'x') == [['error'], 3]
+    assert ResultCache(tmp_path / 'checker.json', [dependency]).get('a.csv', 'y') is None
+    dependency.write_text('ID\nb\n', encoding='utf8')
+    assert ResultCache(tmp_path / 'checker.json', [dependency]).get('a.csv', 'x') is None
+
+    # a truncated cache is treated as empty
+    tmp_path.joinpath('checker.json').write_text('{"namespace": ', encoding='utf8')
+    assert not ResultCache(tmp_path / 'checker.json', [dependency]).previous
+
+
+def test_duplicate_index():
+    from checker import DuplicateIndex
+
+    cells = [DuplicateIndex.cell('%s_%s' % (p, a), 'w%s%s' % (p, a)) for p in range(10) for a in 'asop']
+    index = DuplicateIndex()
+    index.add('A/Nen nenn1238.csv', cells)
+    index.add('A/Nen [ICR] nenn1238.csv', list(reversed(cells)))  # reordered, same language
+    index.add('B/Other abcd1234.csv', cells[:38] + [('9_p', 'x')])  # 38 of 41 cells shared
+    index.add('B/Different efgh1234.csv', [('1sg_a', 'zz')])
+
+    assert index.exact() == [['A/Nen [ICR] nenn1238.csv', 'A/Nen nenn1238.csv']]
+    assert DuplicateIndex.same_language(index.exact()[0])
+    assert not DuplicateIndex.same_language(['A/Nen nenn1238.csv', 'B/Other abcd1234.csv'])
+    near = index.near()
+    assert [(a, b) for a, b, _ in near] == [
+        ('A/Nen [ICR] nenn1238.csv', 'B/Other abcd1234.csv'),
+        ('A/Nen nenn1238.csv', 'B/Other abcd1234.csv')]
+    assert all(s >= index.threshold for _, _, s in near)
+
+
+def test_dumpreader(tmp_path):
+    import gzip
+    import json
+    import sys
+    from pathlib import Path
+    sys.path.insert(0, str(Path(__file__).parent / 'raw' / 'website_dump'))
+    from dumpreader import iter_records
+
+    records = [
+        {'model': 'lexicon.lexicon' if i % 3 else 'pronouns.pronoun', 'pk': i,
+         'fields': {'entry': 'ŋa\u0301 "%d" [, ]' % i, 'values': [i * 1.5, None, True]}}
+        for i in range(50)]
+    text = json.dumps(records, ensure_ascii=False, indent=1)
+    tmp_path.joinpath('dump.json').write_text(text, encoding='utf8')
+    with gzip.open(tmp_path / 'dump.json.gz', 'wt', encoding='utf8') as f:
+        f.write(text)
+
+    for name in ('dump.json', 'dump.json.gz'):
+        for chunksize in (1, 7, 2 ** 16):
+            assert list(iter_records(tmp_path / name, chunksize=chunksize)) == json.loads(text)
+    assert [r['pk'] for r in iter_records(tmp_path / 'dump.json', {'pronouns.pronoun'}, 5)] == \
+        list(range(0, 50, 3))
+
+    tmp_path.joinpath('numbers.json').write_text('[123456, 7]', encoding='utf8')
+    assert list(iter_records(tmp_path / 'numbers.json', chunksize=3)) == [123456, 7]
+    for empty in ('[]', ' [ \n ] '):
+        tmp_path.joinpath('empty.json').write_text(empty, encoding='utf8')
+        assert list(iter_records(tmp_path / 'empty.json', chunksize=1)) == []
+
+
+def test_add_source(tmp_path):
+    import sys
+    from pathlib import Path
+    sys.path.insert(0, str(Path(__file__).parent / 'raw'))
+    from add_source_to import add_source, read_mapping
+
+    header = 'word,ipa,parameter,description,localid,alternative,comment,translation,glottocode,source\r\n'
+    paradigm = tmp_path / 'Family' / 'Nen nenn1238.csv'
+    paradigm.parent.mkdir()
+    paradigm.write_text(
+        header + 'ni,,1sg_a,,,,,,nenn1238,\r\nna,,1sg_s,,,,,,nenn1238,other-2000\r\n', encoding='utf8')
+
+    text = paradigm.read_bytes()
+    _, changed, messages, diff = add_source(paradigm, 'evans-2019', dry_run=True)
+    assert (changed, len(messages)) == (1, 1)
+    assert '+ni,,1sg_a,,,,,,nenn1238,evans-2019' in diff
+    assert paradigm.read_bytes() == text
+
+    assert add_source(paradigm, 'evans-2019')[1:3] == (1, messages)
+    assert paradigm.read_bytes().decode('utf8') == header + \
+        'ni,,1sg_a,,,,,,nenn1238,evans-2019\r\nna,,1sg_s,,,,,,nenn1238,other-2000\r\n'
+
+    # a file without rows keeps its header
+    empty = tmp_path / 'Family' / 'Ta taxx1234.csv'
+    empty.write_text(header, encoding='utf8')
+    assert add_source(empty, 'evans-2019')[1] == 0
+    assert empty.read_bytes().decode('utf8') == header
+
+    mapping = tmp_path / 'sources.tsv'
+    mapping.write_text('Pattern\tSource\nnenn1238\ta\nFamily/*.csv\tb\nxxxx0000\tc\n', encoding='utf8')
+    files, problems = read_mapping(mapping, tmp_path)
+    assert files == {paradigm: 'b', empty: 'b'}
+    assert problems == [
+        "L3 - %s is already mapped to 'a'" % paradigm, "L4 - no files match 'xxxx0000'"]
+
+
+def test_xlsx_router(monkeypatch):
+    import sys
+    from pathlib import Path
+
+    # routing workbooks needs neither Glottolog nor pyglottolog
+    monkeypatch.setitem(sys.modules, 'pyglottolog', None)
+    monkeypatch.delitem(sys.modules, 'website_to_txt', raising=False)
+    monkeypatch.syspath_prepend(str(Path(__file__).parent / 'raw'))
+    from xlsx_to_csv import Router, OUTHEADER, RAW_DIR
+
+    row = [''] * len(OUTHEADER)
+    row[OUTHEADER.index('glottocode')] = 'nenn1238'
+    assert Router()('Nen.xlsx', [row]) == RAW_DIR / 'Other' / 'Nen nenn1238.csv'
+
+
+def test_bibindex(tmp_path):
+    from bibindex import BibIndex
+
+    bib = tmp_path / 'sources.bib'
+    bib.write_text(
+        "@book{a-2000,\n  title = {A},\n  year = 2000\n}\n\n"
+        "@misc{b-2001,\n  title = {B},\n  year = 2001\n}\n", encoding='utf8')
+    index = BibIndex(bib, tmp_path / 'sources.json')
+    assert index.keys() == ['a-2000', 'b-2001'] and index.parsed == 0
+    assert [s.id for s in index.sources(['b-2001'])] == ['b-2001']
+    assert index.text('b-2001').startswith('@misc{b-2001,')
+
+    bib.write_text(bib.read_text(encoding='utf8').replace('{A}', '{AA}'), encoding='utf8')
+    index = BibIndex(bib, tmp_path / 'sources.json')
+    assert [s['title'] for s in index.sources()] == ['AA', 'B']
+    assert index.parsed == 1
+
+    # a truncated index is rebuilt
+    tmp_path.joinpath('sources.json').write_text('{"version": 1, "entr', encoding='utf8')
+    assert BibIndex(bib, tmp_path / 'sources.json').keys() == ['a-2000', 'b-2001']
+
+
+def test_server():
+    import json
+    import threading
+    import http.client
+    from server import PronounIndex, make_server
+
+    server = make_server(PronounIndex(), port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    connection = http.client.HTTPConnection(*server.server_address)
+
+    def get(path, **headers):
+        connection.request('GET', path, headers=headers)
+        response = connection.getresponse()
+        body = response.read()
+        return response.status, response.getheader('ETag'), json.loads(body) if body else None
+
+    try:
+        status, etag, paradigm = get('/languages/nen')
+        assert status == 200 and paradigm['language']['Glottocode'] == 'nenn1238'
+        assert get('/languages/nen') == (200, etag, paradigm)
+        assert server.cache.hits == 1
+        assert get('/languages/nen', **{'If-None-Match': etag})[0] == 304
+
+        status, _, forms = get('/parameters/1sg_a?Glottocode=nenn1238')
+        assert [f['Language_ID'] for f in forms['forms']] == ['nen']
+        assert get('/glottocodes/nenn1238')[2]['languages'][0]['ID'] == 'nen'
+        assert get('/languages/xxx')[0] == 404
+        assert get('/parameters/1sg_a?Colour=red')[0] == 400
+        assert get('/parameters/1sg_a?path=x')[0] == 400
+        assert get('/parameters/1sg_a?parameter_id=x')[0] == 400
+
+        server.index.query = lambda path, params: 1 / 0
+        assert get('/languages/other') == (500, None, {'error': 'ZeroDivisionError: division by zero'})
+    finally:
+        connection.close()
+        server.shutdown()
+        server.server_close()